@@ -0,0 +1,363 @@
+# =========================
+# 이벤트 로그 열(column) 저장소 + 질의 CLI
+# =========================
+# events.jsonl 을 매번 json.loads 로 전부 훑지 않도록, 이벤트마다 자주 쓰는 필드를 꺼내
+# 열별 바이너리 파일(array 모듈, 고정 폭)로 쌓아 둔다. 문자열(sid, event, phase, 질문)은 사전(dictionary) 번호로 저장.
+# - 변환은 증분: 지난번에 어디까지 읽었는지(state.json) 기억하고 그 뒤만 붙인다.
+#   rotate된 세그먼트(logarchive manifest)도 같은 방식으로 이어서 읽는다.
+# - 질의는 필요한 열만 청크 단위로 읽어 스트리밍으로 집계한다.
+#
+#   python analytics.py convert
+#   python analytics.py latency [--sid SID] [--limit 20]
+#   python analytics.py chips
+#   python analytics.py followup
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+from array import array
+from pathlib import Path
+
+from logarchive import read_manifest, zstandard
+
+try:
+    import orjson  # 선택 의존성: 변환 속도용
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+# 열 이름 -> array typecode. 없는 값은 -1 (ts는 nan)
+COLUMNS = {
+    "ts": "d",
+    "sid": "i",
+    "event": "i",
+    "count": "i",
+    "phase": "i",
+    "text_len": "i",
+    "chip": "b",  # user_message: 1 추천 질문 버튼, 0 직접 입력 (플래그 없던 옛 로그는 -1)
+}
+DICT_COLUMNS = ("sid", "event", "phase")
+CHUNK_ROWS = 1 << 18
+
+
+class Dictionary:
+    # 문자열 <-> 번호. 새 항목은 <이름>.dict 에 한 줄씩 append
+    def __init__(self, path: Path):
+        self.path = path
+        self.values: list[str] = []
+        self.index: dict[str, int] = {}
+        if path.exists():
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    value = json.loads(line)
+                    self.index[value] = len(self.values)
+                    self.values.append(value)
+        self.saved = len(self.values)
+
+    def id(self, value) -> int:
+        if value is None:
+            return -1
+        value = str(value)
+        i = self.index.get(value)
+        if i is None:
+            i = self.index[value] = len(self.values)
+            self.values.append(value)
+        return i
+
+    def get(self, value: str) -> int:
+        return self.index.get(value, -2)  # 없는 문자열은 어떤 행과도 같지 않게
+
+    def save(self):
+        if self.saved == len(self.values):
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(v, ensure_ascii=False) + "\n" for v in self.values[self.saved:]))
+        self.saved = len(self.values)
+
+
+class ColumnStore:
+    def __init__(self, root: Path):
+        self.root = root
+        root.mkdir(parents=True, exist_ok=True)
+        self.state_path = root / "state.json"
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                self.state = json.load(f)
+        except FileNotFoundError:
+            self.state = {"rows": 0, "done_segments": [], "partials": {}, "active": None}
+        self.dicts = {name: Dictionary(root / f"{name}.dict") for name in DICT_COLUMNS}
+        self._repair()
+
+    def column_path(self, name: str) -> Path:
+        return self.root / f"{name}.col"
+
+    def _repair(self):
+        # 지난 변환이 중간에 끊겼으면 state에 기록된 행 수까지만 남긴다
+        rows = self.state["rows"]
+        for name, code in COLUMNS.items():
+            path = self.column_path(name)
+            size = rows * array(code).itemsize
+            if path.exists() and path.stat().st_size != size:
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+
+    def rows(self) -> int:
+        return self.state["rows"]
+
+    # ---- 변환 ----
+    def append(self, lines, cols: dict[str, array]) -> int:
+        sid_d, event_d, phase_d = (self.dicts[n] for n in DICT_COLUMNS)
+        n = 0
+        for line in lines:
+            try:
+                e = _loads(line)
+            except ValueError:
+                continue
+            text = e.get("text")
+            count = e.get("count")
+            chip = e.get("chip")
+            cols["ts"].append(float(e.get("ts") or "nan"))
+            cols["sid"].append(sid_d.id(e.get("sid")))
+            cols["event"].append(event_d.id(e.get("event")))
+            cols["count"].append(count if isinstance(count, int) else -1)
+            cols["phase"].append(phase_d.id(e.get("phase")))
+            cols["text_len"].append(len(text) if isinstance(text, str) else -1)
+            cols["chip"].append(-1 if chip is None else int(bool(chip)))
+            n += 1
+        return n
+
+    def _flush(self, cols: dict[str, array], n: int):
+        for name, arr in cols.items():
+            with open(self.column_path(name), "ab") as f:
+                arr.tofile(f)
+        for d in self.dicts.values():
+            d.save()
+        self.state["rows"] += n
+        tmp = self.state_path.with_name(".state.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.state_path)
+
+    def convert(self, log_dir: Path, active: Path) -> int:
+        added = 0
+        done = set(self.state["done_segments"])
+        # 첫 줄 지문 -> 이미 읽은 바이트 수. 활성 파일이 rotate되면 첫 줄이 같은 세그먼트가 되므로 거기서 이어 읽는다
+        partials: dict[str, int] = self.state["partials"]
+        prev = self.state.pop("active", None)
+        if prev:
+            partials[prev["fp"]] = prev["offset"]
+
+        def mark(fp):
+            def set_offset(pos):
+                partials[fp] = pos
+            return set_offset
+
+        # 1) rotate된 세그먼트 (manifest 순서 = 시간 순)
+        for seg in read_manifest(log_dir):
+            if seg["kind"] != "events" or seg["file"] in done:
+                continue
+            path = log_dir / seg["file"]
+            with _open_binary(path) as f:
+                fp = _fingerprint(f.readline())
+            with _open_binary(path) as f:
+                added += self._run_stream(f, partials.get(fp, 0), mark(fp))
+            partials.pop(fp, None)
+            self.state["done_segments"].append(seg["file"])
+            self._save_state()
+        # 2) 지금 쓰고 있는 events.jsonl (아직 manifest에 안 올라온 세그먼트 몫은 partials에 남겨 둔다)
+        if active.exists():
+            with open(active, "rb") as f:
+                fp = _fingerprint(f.readline())
+            if fp:
+                with open(active, "rb") as f:
+                    added += self._run_stream(f, partials.get(fp, 0), mark(fp))
+                self.state["active"] = {"fp": fp, "offset": partials.pop(fp)}
+        self._save_state()
+        return added
+
+    def _run_stream(self, f, skip: int, set_offset) -> int:
+        # skip 바이트 뒤의 완결된 줄만 CHUNK_ROWS개씩 변환. 청크마다 열 + 읽은 위치를 함께 저장
+        pos = 0
+        while pos < skip:
+            chunk = f.read(min(1 << 20, skip - pos))
+            if not chunk:
+                break
+            pos += len(chunk)
+        set_offset(pos)
+        total = 0
+        while True:
+            cols = {name: array(code) for name, code in COLUMNS.items()}
+            lines = []
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # 아직 쓰는 중인 마지막 줄은 다음 변환 때
+                pos += len(line)
+                lines.append(line)
+                if len(lines) >= CHUNK_ROWS:
+                    break
+            if not lines:
+                return total
+            n = self.append(lines, cols)
+            set_offset(pos)
+            self._flush(cols, n)
+            total += n
+
+    def _save_state(self):
+        self._flush({name: array(code) for name, code in COLUMNS.items()}, 0)
+
+    # ---- 읽기 ----
+    def scan(self, names: list[str]):
+        # 필요한 열만 CHUNK_ROWS 행씩 (array 튜플) 읽는다
+        rows = self.rows()
+        files = [open(self.column_path(n), "rb") for n in names]
+        try:
+            done = 0
+            while done < rows:
+                k = min(CHUNK_ROWS, rows - done)
+                chunk = []
+                for name, f in zip(names, files):
+                    arr = array(COLUMNS[name])
+                    arr.fromfile(f, k)
+                    chunk.append(arr)
+                yield chunk
+                done += k
+        finally:
+            for f in files:
+                f.close()
+
+
+def _open_binary(path: Path):
+    # 세그먼트를 바이트 줄 단위로 연다 (압축 여부 무관)
+    name = str(path)
+    if name.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if name.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"{path}: zstandard is not installed")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True))
+    return open(path, "rb")
+
+
+def _fingerprint(first_line: bytes) -> str:
+    return hashlib.sha256(first_line).hexdigest() if first_line.endswith(b"\n") else ""
+
+
+def _pct(values: list[float], q: float) -> float:
+    return values[min(len(values) - 1, int(q * len(values)))] if values else float("nan")
+
+
+# =========================
+# 질의
+# =========================
+def query_latency(store: ColumnStore, sid: str | None, limit: int):
+    # 턴 지연: user_message -> 같은 sid의 다음 count_inc (답변 전송 완료) 까지
+    ev = store.dicts["event"]
+    user_msg, count_inc = ev.get("user_message"), ev.get("count_inc")
+    only = store.dicts["sid"].get(sid) if sid else None
+    started: dict[int, float] = {}
+    per_sid: dict[int, list[float]] = {}
+    for ts, sids, events in store.scan(["ts", "sid", "event"]):
+        for i in range(len(ts)):
+            e = events[i]
+            if e != user_msg and e != count_inc:
+                continue
+            s = sids[i]
+            if only is not None and s != only:
+                continue
+            if e == user_msg:
+                started[s] = ts[i]
+            else:
+                t0 = started.pop(s, None)
+                if t0 is not None:
+                    per_sid.setdefault(s, []).append(ts[i] - t0)
+    all_turns = sorted(x for v in per_sid.values() for x in v)
+    print(f"turns: {len(all_turns)}  sessions: {len(per_sid)}")
+    if all_turns:
+        print(f"latency p50={_pct(all_turns, .5):.2f}s p90={_pct(all_turns, .9):.2f}s "
+              f"p99={_pct(all_turns, .99):.2f}s max={all_turns[-1]:.2f}s")
+    names = store.dicts["sid"].values
+    rows = sorted(per_sid.items(), key=lambda kv: -max(kv[1]))[:limit]
+    if rows:
+        print(f"\n{'sid':<40} turns   mean    max")
+        for s, v in rows:
+            print(f"{names[s]:<40} {len(v):>5} {sum(v) / len(v):>6.2f} {max(v):>6.2f}")
+
+
+def query_chips(store: ColumnStore):
+    # user_message 질문이 추천 질문 버튼(chip)인지 직접 입력인지 (세션 내 몇 번째 질문인지별)
+    user_msg = store.dicts["event"].get("user_message")
+    nth: dict[int, int] = {}
+    table: dict[int, list[int]] = {}  # 몇 번째 질문 -> [chip, 직접 입력, 알 수 없음]
+    for sids, events, chips in store.scan(["sid", "event", "chip"]):
+        for i in range(len(sids)):
+            if events[i] != user_msg:
+                continue
+            k = nth[sids[i]] = nth.get(sids[i], 0) + 1
+            table.setdefault(k, [0, 0, 0])[0 if chips[i] == 1 else 1 if chips[i] == 0 else 2] += 1
+    chip, free, unknown = (sum(r[j] for r in table.values()) for j in range(3))
+    known = chip + free
+    print(f"questions: {known + unknown}  chip: {chip} ({chip / known:.1%})  free text: {free} ({free / known:.1%})"
+          if known else f"questions: {unknown}")
+    if unknown:
+        print(f"  (without chip flag: {unknown})")
+    for k in sorted(table):
+        c, f, _ = table[k]
+        print(f"  question #{k}: chip {c:>7}  free {f:>7}" + (f"  chip share {c / (c + f):.1%}" if c + f else ""))
+
+
+def query_followup(store: ColumnStore):
+    # followup 단계에 들어간 세션 중 실제로 답을 남긴 비율
+    ev = store.dicts["event"]
+    hello, enter, answer = ev.get("hello"), ev.get("enter_followup"), ev.get("followup_answer")
+    started, entered, answered = set(), set(), set()
+    for sids, events in store.scan(["sid", "event"]):
+        for i in range(len(sids)):
+            e = events[i]
+            if e == hello:
+                started.add(sids[i])
+            elif e == enter:
+                entered.add(sids[i])
+            elif e == answer:
+                answered.add(sids[i])
+    rate = lambda a, b: f"{len(a) / len(b):.1%}" if b else "n/a"
+    print(f"sessions started : {len(started)}")
+    print(f"reached followup : {len(entered)} ({rate(entered, started)} of started)")
+    print(f"followup answered: {len(answered)} ({rate(answered & entered, entered)} of reached, "
+          f"{rate(answered, started)} of started)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="columnar store and queries over logs/events.jsonl")
+    parser.add_argument("--logs", default="logs", help="log directory (events.jsonl + manifest.json)")
+    parser.add_argument("--store", default=None, help="column store directory (default: <logs>/columnar)")
+    parser.add_argument("--no-convert", action="store_true", help="query without converting new events first")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("convert", help="append new events to the column store")
+    p = sub.add_parser("latency", help="per-sid turn latency (user_message -> count_inc)")
+    p.add_argument("--sid")
+    p.add_argument("--limit", type=int, default=20, help="slowest sessions to list")
+    sub.add_parser("chips", help="recommended-question chips vs free-text questions")
+    sub.add_parser("followup", help="followup completion rate")
+    args = parser.parse_args()
+
+    log_dir = Path(args.logs)
+    store = ColumnStore(Path(args.store) if args.store else log_dir / "columnar")
+    if args.cmd == "convert" or not args.no_convert:
+        t0 = time.perf_counter()
+        added = store.convert(log_dir, log_dir / "events.jsonl")
+        print(f"converted {added} new events ({store.rows()} total) in {time.perf_counter() - t0:.2f}s",
+              file=sys.stderr)
+    if args.cmd == "latency":
+        query_latency(store, args.sid, args.limit)
+    elif args.cmd == "chips":
+        query_chips(store)
+    elif args.cmd == "followup":
+        query_followup(store)
+
+
+if __name__ == "__main__":
+    main()
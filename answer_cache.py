@@ -0,0 +1,205 @@
+# =========================
+# 1) 추천 질문(chip) 답변 사전 생성 캐시
+# =========================
+# 세션 첫 질문이 추천 질문 라벨과 정확히 같으면 답변은 프롬프트/사실관계/모델에만
+# 의존하므로, 미리 만들어 두고 OpenAI 호출 없이 바로 내보낸다.
+# 키에 프롬프트/사실관계/모델 해시가 들어가므로 셋 중 하나라도 바뀌면 자동으로 무효화된다.
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+
+from eventlog import LogWriter
+
+
+def fingerprint(*parts: str) -> str:
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(p.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class ChipAnswerStore:
+    def __init__(self, path: Path, prompt: str, facts: str, model: str):
+        self.path = path
+        self.prompt_fp = fingerprint(prompt, facts, model)
+        self.answers: dict[str, dict] = {}  # key -> {"label", "answer", "ts"}
+
+    def key(self, label: str) -> str:
+        return fingerprint(self.prompt_fp, label)
+
+    def load(self):
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            data = {}
+        # 지금 프롬프트/모델 기준으로 계산한 키와 맞는 항목만 살림
+        self.answers = {
+            k: v for k, v in data.items()
+            if isinstance(v, dict) and k == self.key(v.get("label", ""))
+        }
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # worker마다 임시 파일을 따로 써야 서로 덮어쓰지 않는다 (교체는 os.replace로 원자적)
+        tmp = self.path.with_suffix(f"{self.path.suffix}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(self.answers, ensure_ascii=False, indent=1), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def get(self, label: str) -> str | None:
+        entry = self.answers.get(self.key(label))
+        return entry["answer"] if entry else None
+
+    def put(self, label: str, answer: str):
+        self.answers[self.key(label)] = {"label": label, "answer": answer, "ts": time.time()}
+
+    def missing(self, labels) -> list[str]:
+        return [label for label in labels if self.get(label) is None]
+
+    async def warm(self, labels, generate, concurrency: int = 4) -> list[tuple[str, Exception]]:
+        # generate(label) -> answer 를 빠진 라벨에 대해서만 호출하고 파일로 저장
+        slots = asyncio.Semaphore(concurrency)
+        errors: list[tuple[str, Exception]] = []
+
+        async def one(label: str):
+            async with slots:
+                try:
+                    answer = await generate(label)
+                except Exception as e:
+                    errors.append((label, e))
+                    return
+            if answer:
+                # 중간에 취소돼도 만든 만큼은 남도록 하나씩 저장
+                self.put(label, answer)
+                self.save()
+
+        await asyncio.gather(*(one(label) for label in self.missing(labels)))
+        return errors
+
+
+# =========================
+# 2) 대화 문맥 기반 응답 캐시 (LRU + TTL)
+# =========================
+# 같은 질문 순서(q1 -> q3 -> q7 ...)를 밟는 세션이 많으므로, 정규화한 (trim된) history +
+# user_text + 모델/프롬프트 지문을 키로 답변을 재사용한다.
+# path를 주면 SQLite 파일에도 보관한다. 조회는 메모리에서만 하고(시작할 때 파일 내용을 한 번 읽어 옴),
+# 쓰기는 로그와 같은 방식으로 전용 스레드가 모아서 batch 하나당 commit 한 번으로 처리한다.
+_SPACES = re.compile(r"\s+")
+
+def normalize_text(text: str) -> str:
+    # 유니코드 정규화 + 대소문자/문장부호/공백 차이를 접는다
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = "".join(" " if unicodedata.category(ch).startswith("P") else ch for ch in text)
+    return _SPACES.sub(" ", text).strip()
+
+
+class _ResponseCacheSink:
+    # LogWriter sink: "response" 레코드를 batch 하나당 트랜잭션 하나로 기록
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+
+    def write(self, batch: list[tuple[str, dict]]):
+        rows = [(r["key"], r["ts"], r["answer"]) for kind, r in batch if kind == "response"]
+        if rows:
+            self.db.executemany("INSERT OR REPLACE INTO response_cache (key, ts, answer) VALUES (?, ?, ?)", rows)
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+class ResponseCache:
+    def __init__(self, prompt_fp: str, max_entries: int = 5000, max_bytes: int = 32 * 1024 * 1024,
+                 ttl_seconds: float = 24 * 3600, path: Path | None = None):
+        self.prompt_fp = prompt_fp
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.entries: OrderedDict[str, tuple[float, str]] = OrderedDict()  # key -> (ts, answer)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writer: LogWriter | None = None
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(path, timeout=10.0, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("CREATE TABLE IF NOT EXISTS response_cache (key TEXT PRIMARY KEY, ts REAL, answer TEXT)")
+            db.execute("DELETE FROM response_cache WHERE ts < ?", (time.time() - ttl_seconds,))
+            db.commit()
+            # 최근 것부터 max_entries개를 읽어 오래된 것부터 넣는다 (LRU 순서 유지)
+            rows = db.execute(
+                "SELECT key, ts, answer FROM response_cache ORDER BY ts DESC LIMIT ?", (max_entries,)
+            ).fetchall()
+            for key, ts, answer in reversed(rows):
+                self._insert(key, ts, answer)
+            self.writer = LogWriter(_ResponseCacheSink(db))
+
+    def make_key(self, history: list[dict], user_text: str) -> str:
+        parts = [self.prompt_fp]
+        for m in history:
+            parts.append(m["role"])
+            parts.append(normalize_text(m["content"]))
+        parts.append(normalize_text(user_text))
+        return fingerprint(*parts)
+
+    @staticmethod
+    def _size(key: str, answer: str) -> int:
+        return len(key) + len(answer.encode("utf-8"))
+
+    def _drop(self, key: str):
+        _, answer = self.entries.pop(key)
+        self.bytes -= self._size(key, answer)
+
+    def _insert(self, key: str, ts: float, answer: str):
+        if key in self.entries:
+            self._drop(key)
+        self.entries[key] = (ts, answer)
+        self.bytes += self._size(key, answer)
+        while self.entries and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+            self._drop(next(iter(self.entries)))
+            self.evictions += 1
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        entry = self.entries.get(key)
+        if entry is not None and now - entry[0] > self.ttl_seconds:
+            self._drop(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: str, answer: str):
+        ts = time.time()
+        self._insert(key, ts, answer)
+        if self.writer is not None:
+            # 큐가 가득 차면 디스크 보관만 건너뜀 (메모리 캐시에는 이미 들어감)
+            self.writer.submit("response", {"key": key, "ts": ts, "answer": answer})
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def close(self):
+        # 큐에 남은 쓰기까지 기록하고 닫는다
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
@@ -0,0 +1,109 @@
+# =========================
+# 세션 시계: 시간 종료 + 주기적 동기화 tick
+# =========================
+# 연결마다 타이머 task를 두지 않고, 만료 시각 heap 하나와 task 하나로 모든 연결을 돌본다.
+# - 만료 시각이 지나면 on_expire() (종료 안내 + 연결 닫기) — 입력이 없는 참가자도 서버가 먼저 끝낸다
+# - tick_interval마다 on_tick() (남은 시간 동기화) — 클라이언트 setTimeout이 밀려도 다시 맞춰진다
+# 시각은 Session.chat_ts(채팅 시작 시각)와 같은 time.time() 기준.
+import asyncio
+import heapq
+import itertools
+import time
+
+
+class ClockEntry:
+    __slots__ = ("key", "expires_at", "seq", "on_expire", "on_tick", "cancelled", "expired")
+
+    def __init__(self, key, expires_at: float, seq: int, on_expire, on_tick):
+        self.key = key
+        self.expires_at = expires_at
+        self.seq = seq
+        self.on_expire = on_expire
+        self.on_tick = on_tick
+        self.cancelled = False
+        self.expired = False  # on_expire가 불렸는지 (ws 루프가 확인하고 빠져나감)
+
+    def __lt__(self, other: "ClockEntry") -> bool:
+        return (self.expires_at, self.seq) < (other.expires_at, other.seq)
+
+
+class SessionClock:
+    def __init__(self, tick_interval: float = 10.0):
+        self.tick_interval = tick_interval  # 0이면 tick 없음
+        self._heap: list[ClockEntry] = []  # 취소된 항목은 꺼낼 때 버림
+        self._entries: dict = {}
+        self._seq = itertools.count()
+        self._task: asyncio.Task | None = None
+        self._changed = asyncio.Event()
+        self._running: set[asyncio.Task] = set()
+        self.expired_total = 0
+
+    def register(self, key, expires_at: float, on_expire, on_tick=None) -> ClockEntry:
+        # on_expire(), on_tick()은 인자 없는 async 함수
+        self.unregister(key)
+        entry = ClockEntry(key, expires_at, next(self._seq), on_expire, on_tick)
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+        if self._heap[0] is entry:
+            self._changed.set()  # 지금 자고 있는 시각보다 먼저 깨어나야 함
+        return entry
+
+    def unregister(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry.cancelled = True
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _ticks(self, entries: list[ClockEntry]):
+        await asyncio.gather(*(e.on_tick() for e in entries), return_exceptions=True)
+
+    async def _run(self):
+        next_tick = time.time() + self.tick_interval
+        while True:
+            while self._heap and self._heap[0].cancelled:
+                heapq.heappop(self._heap)
+            wake = next_tick if self.tick_interval else float("inf")
+            if self._heap:
+                wake = min(wake, self._heap[0].expires_at)
+            self._changed.clear()
+            timeout = None if wake == float("inf") else max(0.0, wake - time.time())
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+            now = time.time()
+            while self._heap and self._heap[0].expires_at <= now:
+                entry = heapq.heappop(self._heap)
+                if entry.cancelled:
+                    continue
+                self._entries.pop(entry.key, None)
+                entry.expired = True
+                self.expired_total += 1
+                self._spawn(entry.on_expire())
+
+            if self.tick_interval and now >= next_tick:
+                next_tick = now + self.tick_interval
+                entries = [e for e in self._entries.values() if e.on_tick is not None]
+                if entries:
+                    self._spawn(self._ticks(entries))
@@ -0,0 +1,256 @@
+# =========================
+# 실시간 관리자 대시보드 집계
+# =========================
+# log_event로 기록되는 이벤트를 프로세스 내 이벤트 버스로도 흘려보내고,
+# LiveStats가 이벤트 하나당 상수 시간만 써서 집계를 갱신한다. (파일을 다시 읽지 않음)
+#   - 진행 중인 세션 수 (phase별)
+#   - 분당 턴 수 (최근 60초)
+#   - 답변 지연 p50/p95 (최근 5분, turn_timing.total)
+#   - 오류 수 (종류별 누적 + 최근 5분)
+#   - 최근 followup 답변
+# 시간 창은 고정 칸(slot) 고리로 두고 시각이 지나면 칸을 비우기만 하므로, 참가자가 많아도
+# 이벤트당 비용은 dict 갱신 몇 번이다. snapshot()은 초당 한 번만 계산해 모든 관리자 연결이 공유한다.
+# 이벤트 루프 스레드에서만 쓰므로 lock은 없다.
+# 버스와 집계는 프로세스 안에만 있으므로 uvicorn --workers N 이면 worker 하나가 받은 이벤트만 보인다.
+import math
+import time
+from collections import deque
+
+import frames
+
+# 지연 버킷: 10ms ~ 약 160s 를 10% 간격으로 (백분위 오차 5% 이내)
+_LATENCY_BASE = 0.01
+_LATENCY_STEP = math.log(1.1)
+_LATENCY_BUCKETS = 102
+
+# 세션을 끝내는 이벤트 (이후로는 진행 중으로 세지 않음)
+_ENDING_EVENTS = {"done", "exit", "time_over"}
+# 연결 하나가 끊긴 이벤트. 재접속(resume)한 새 연결이 아직 열려 있으면 진행 중으로 남긴다
+_CLOSING_EVENTS = {"disconnect", "error"}
+ERROR_EVENTS = {"gpt_error", "error", "chip_warm_error", "unknown_input",
+                "blocked_message_phase", "blocked_followup_phase", "blocked_message_length"}
+
+
+class EventBus:
+    # 구독자는 event dict를 받는 동기 함수. 발행은 log_event에서 (구독자 예외는 로그 기록을 막지 않음)
+    def __init__(self):
+        self.subscribers: list = []
+        self.errors = 0
+
+    def subscribe(self, fn):
+        self.subscribers.append(fn)
+
+    def unsubscribe(self, fn):
+        if fn in self.subscribers:
+            self.subscribers.remove(fn)
+
+    def publish(self, event: dict):
+        for fn in self.subscribers:
+            try:
+                fn(event)
+            except Exception:
+                self.errors += 1
+
+
+class RollingSlots:
+    # slot_seconds 간격 칸 n개짜리 고리. 각 칸은 make()로 만든 값 (숫자 또는 list)
+    __slots__ = ("slot_seconds", "slots", "epochs", "make")
+
+    def __init__(self, n: int, slot_seconds: float, make):
+        self.slot_seconds = slot_seconds
+        self.make = make
+        self.slots = [make() for _ in range(n)]
+        self.epochs = [-1] * n  # 칸마다 마지막으로 쓴 구간 번호 (다르면 오래된 칸)
+
+    def current(self, now: float):
+        epoch = int(now // self.slot_seconds)
+        i = epoch % len(self.slots)
+        if self.epochs[i] != epoch:
+            self.epochs[i] = epoch
+            self.slots[i] = self.make()
+        return i
+
+    def live(self, now: float):
+        # 아직 창 안에 있는 칸들
+        epoch = int(now // self.slot_seconds)
+        n = len(self.slots)
+        return [self.slots[i] for i in range(n) if epoch - n < self.epochs[i] <= epoch]
+
+
+def _latency_bucket(seconds: float) -> int:
+    if seconds <= _LATENCY_BASE:
+        return 0
+    return min(_LATENCY_BUCKETS - 1, int(math.log(seconds / _LATENCY_BASE) / _LATENCY_STEP) + 1)
+
+
+def _bucket_value(i: int) -> float:
+    # 버킷 상한
+    return _LATENCY_BASE * math.exp(_LATENCY_STEP * i)
+
+
+class LiveStats:
+    def __init__(self, recent_followups: int = 20, latency_window_minutes: int = 5, clock=time.time):
+        self.clock = clock
+        self.phase_of: dict[str, str] = {}  # 진행 중인 sid -> phase
+        self.connections: dict[str, int] = {}  # 진행 중인 sid -> 열린 연결 수
+        self.phase_counts: dict[str, int] = {}
+        self.turns_total = 0
+        self.turns = RollingSlots(60, 1.0, int)  # 최근 60초, 초 단위
+        self.latency = RollingSlots(latency_window_minutes, 60.0, lambda: [0] * _LATENCY_BUCKETS)
+        self.errors: dict[str, int] = {}
+        self.errors_recent = RollingSlots(latency_window_minutes, 60.0, int)
+        self.followups: deque = deque(maxlen=recent_followups)
+        self.events_total = 0
+        self._cache_key = None
+        self._cache = ""
+
+    # ---- 이벤트 ----
+    def _set_phase(self, sid: str, phase: str | None):
+        old = self.phase_of.pop(sid, None)
+        if old is not None:
+            self.phase_counts[old] -= 1
+        if phase is not None:
+            self.phase_of[sid] = phase
+            self.phase_counts[phase] = self.phase_counts.get(phase, 0) + 1
+
+    def on_event(self, event: dict):
+        self.events_total += 1
+        name = event.get("event")
+        sid = event.get("sid")
+        now = event.get("ts") or self.clock()
+        if name == "connect":
+            self.connections[sid] = self.connections.get(sid, 0) + 1
+            self._set_phase(sid, event.get("phase") or "qa")
+        elif name in ("enter_followup", "blocked_message_limit"):
+            if sid in self.phase_of:
+                self._set_phase(sid, "followup")
+        elif name in _ENDING_EVENTS:
+            self.connections.pop(sid, None)
+            self._set_phase(sid, None)
+        elif name in _CLOSING_EVENTS:
+            # 이미 끝난 세션이거나 모르는 sid면 무시
+            n = self.connections.get(sid)
+            if n is not None:
+                if n > 1:
+                    self.connections[sid] = n - 1
+                else:
+                    del self.connections[sid]
+                    self._set_phase(sid, None)
+        elif name == "turn_timing":
+            self.turns_total += 1
+            self.turns.slots[self.turns.current(now)] += 1
+            total = event.get("total")
+            if total is not None:
+                self.latency.slots[self.latency.current(now)][_latency_bucket(total)] += 1
+        elif name == "followup_answer":
+            self.followups.append({"ts": now, "sid": sid, "text": (event.get("text") or "")[:200]})
+        if name in ERROR_EVENTS:
+            self.errors[name] = self.errors.get(name, 0) + 1
+            self.errors_recent.slots[self.errors_recent.current(now)] += 1
+
+    # ---- 조회 ----
+    def _percentiles(self, now: float, qs=(0.5, 0.95)) -> tuple[int, list[float | None]]:
+        merged = [0] * _LATENCY_BUCKETS
+        for slot in self.latency.live(now):
+            for i, c in enumerate(slot):
+                if c:
+                    merged[i] += c
+        n = sum(merged)
+        out = []
+        for q in qs:
+            if not n:
+                out.append(None)
+                continue
+            rank, acc = q * n, 0
+            for i, c in enumerate(merged):
+                acc += c
+                if acc >= rank:
+                    out.append(round(_bucket_value(i), 3))
+                    break
+        return n, out
+
+    def snapshot(self) -> dict:
+        now = self.clock()
+        n, (p50, p95) = self._percentiles(now)
+        return {
+            "type": "stats",
+            "ts": now,
+            "sessions": {phase: c for phase, c in self.phase_counts.items() if c},
+            "active_sessions": len(self.phase_of),
+            "turns_per_minute": sum(self.turns.live(now)),
+            "turns_total": self.turns_total,
+            "latency": {"p50": p50, "p95": p95, "turns": n, "window_seconds": len(self.latency.slots) * 60},
+            "errors": dict(self.errors),
+            "errors_recent": sum(self.errors_recent.live(now)),
+            "recent_followups": list(self.followups)[::-1],
+            "events_total": self.events_total,
+        }
+
+    def frame(self) -> str:
+        # 같은 초에 같은 이벤트 수면 직전 직렬화 결과를 재사용 (관리자 연결이 여럿이어도 한 번만 계산)
+        key = (int(self.clock()), self.events_total)
+        if key != self._cache_key:
+            self._cache_key = key
+            self._cache = frames.dumps(self.snapshot())
+        return self._cache
+
+
+ADMIN_HTML = """<!doctype html>
+<html lang="ko">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>Admin</title>
+<style>
+  body { font-family: system-ui, sans-serif; margin: 24px; color: #222; background: #f6f7f9; }
+  h1 { font-size: 20px; margin: 0 0 16px; }
+  .grid { display: grid; grid-template-columns: repeat(auto-fill, minmax(180px, 1fr)); gap: 12px; }
+  .card { background: #fff; border-radius: 10px; padding: 14px; box-shadow: 0 1px 3px rgba(0,0,0,.08); }
+  .card .label { font-size: 12px; color: #666; }
+  .card .value { font-size: 26px; font-weight: 600; margin-top: 4px; }
+  table { width: 100%; border-collapse: collapse; background: #fff; margin-top: 16px; }
+  th, td { text-align: left; padding: 6px 10px; border-bottom: 1px solid #eee; font-size: 13px; vertical-align: top; }
+  #status { font-size: 12px; color: #888; margin-bottom: 12px; }
+</style>
+</head>
+<body>
+<h1>실시간 현황</h1>
+<div id="status">연결 중...</div>
+<div class="grid" id="cards"></div>
+<table><thead><tr><th>phase</th><th>세션</th></tr></thead><tbody id="phases"></tbody></table>
+<table><thead><tr><th>오류</th><th>누적</th></tr></thead><tbody id="errors"></tbody></table>
+<table><thead><tr><th>시각</th><th>sid</th><th>followup</th></tr></thead><tbody id="followups"></tbody></table>
+<script>
+const $ = (id) => document.getElementById(id);
+const esc = (s) => String(s).replace(/[&<>"]/g, (c) => ({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;"}[c]));
+const fmtSec = (v) => v == null ? "-" : (v < 1 ? Math.round(v * 1000) + "ms" : v.toFixed(2) + "s");
+
+function render(s) {
+  const cards = [
+    ["진행 중 세션", s.active_sessions],
+    ["분당 턴", s.turns_per_minute],
+    ["답변 p50", fmtSec(s.latency.p50)],
+    ["답변 p95", fmtSec(s.latency.p95)],
+    ["최근 5분 오류", s.errors_recent],
+    ["누적 턴", s.turns_total],
+  ];
+  $("cards").innerHTML = cards.map(([k, v]) =>
+    `<div class="card"><div class="label">${k}</div><div class="value">${esc(v)}</div></div>`).join("");
+  $("phases").innerHTML = Object.entries(s.sessions).map(([k, v]) => `<tr><td>${esc(k)}</td><td>${v}</td></tr>`).join("");
+  $("errors").innerHTML = Object.entries(s.errors).map(([k, v]) => `<tr><td>${esc(k)}</td><td>${v}</td></tr>`).join("");
+  $("followups").innerHTML = s.recent_followups.map((f) =>
+    `<tr><td>${new Date(f.ts * 1000).toLocaleTimeString()}</td><td>${esc(f.sid)}</td><td>${esc(f.text)}</td></tr>`).join("");
+  $("status").textContent = "갱신: " + new Date(s.ts * 1000).toLocaleTimeString() + " · 이벤트 " + s.events_total;
+}
+
+function connect() {
+  const proto = location.protocol === "https:" ? "wss" : "ws";
+  const ws = new WebSocket(`${proto}://${location.host}/admin/ws${location.search}`);
+  ws.onmessage = (ev) => render(JSON.parse(ev.data));
+  ws.onclose = () => { $("status").textContent = "연결 끊김, 다시 연결 중..."; setTimeout(connect, 2000); };
+}
+connect();
+</script>
+</body>
+</html>
+"""
@@ -0,0 +1,293 @@
+# =========================
+# 백그라운드 로그 기록기
+# =========================
+# log_event가 이벤트 루프에서 매번 파일을 열고/쓰고/닫지 않도록, 레코드를 bounded queue에
+# 넣기만 하고 전용 스레드가 모아서(batch) 한 번에 기록한다.
+# 큐가 가득 차면 루프를 막지 않고 버리며(dropped), 종료 시에는 남은 것을 모두 flush 한다.
+# 기록에 실패한 레코드는 버리지 않고 sink별로 보관했다가 다음 batch 때(한가하면 retry_interval마다) 다시 쓴다.
+# 파일은 크기/시간 기준으로 잘라(rotate) 세그먼트로 넘기고, 압축/manifest/보존은 logarchive가 맡는다.
+import atexit
+import csv
+import io
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+from logarchive import dir_lock, segment_name
+
+_STOP = object()
+
+
+class RotatingFile:
+    # append 전용 파일. max_bytes를 넘거나 rotate_seconds 구간(UTC 기준)이 바뀌면
+    # 현재 파일을 세그먼트 이름으로 바꾸고 새 파일을 연다. (0이면 해당 기준 없음)
+    # archive.rotated(segment, kind, fmt)로 잘린 세그먼트를 넘긴다.
+    def __init__(self, path: Path, kind: str, fmt: str, max_bytes: int = 0, rotate_seconds: float = 0,
+                 archive=None, header: str = "", newline: str | None = None):
+        self.path = path
+        self.kind = kind
+        self.fmt = fmt
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.archive = archive
+        self.header = header  # 새 파일(세그먼트)마다 맨 앞에 쓸 내용 (CSV 헤더)
+        self.newline = newline
+        self.f = None
+
+    def _open(self):
+        self.f = self.path.open("a", encoding="utf-8", newline=self.newline)
+        if self.header and self.f.tell() == 0:
+            self.f.write(self.header)
+
+    def _bucket(self, ts: float) -> int:
+        return int(ts // self.rotate_seconds)
+
+    def _should_rotate(self, st: os.stat_result, now: float) -> bool:
+        if st.st_size <= len(self.header):
+            return False
+        if self.max_bytes and st.st_size >= self.max_bytes:
+            return True
+        # 마지막으로 쓴 시각이 이전 구간이면 새 구간 파일로
+        return bool(self.rotate_seconds) and self._bucket(st.st_mtime) != self._bucket(now)
+
+    def _maybe_rotate(self):
+        now = time.time()
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if self.f is not None and os.fstat(self.f.fileno()).st_ino != st.st_ino:
+            # 다른 worker가 이미 잘라냄: 새 파일로 다시 연다
+            self.f.close()
+            self.f = None
+        if not self._should_rotate(st, now):
+            return
+        with dir_lock(self.path.parent):
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                return
+            if not self._should_rotate(st, now):
+                return
+            if self.f is not None:
+                self.f.close()
+                self.f = None
+            segment = segment_name(self.path, now)
+            try:
+                os.rename(self.path, segment)
+            except OSError:
+                return  # (Windows) 다른 프로세스가 열고 있으면 다음 batch 때 다시 시도
+        if self.archive is not None:
+            self.archive.rotated(segment, self.kind, self.fmt)
+
+    def write(self, text: str):
+        self._maybe_rotate()
+        if self.f is None:
+            self._open()
+        # 여러 worker가 같은 파일에 append 하므로 한 batch를 write 한 번으로 기록
+        self.f.write(text)
+        self.f.flush()
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+
+class JsonlSink:
+    # kind == "event" 레코드를 한 줄 JSON으로 append (기존 events.jsonl 형식 그대로)
+    def __init__(self, path: Path, max_bytes: int = 0, rotate_seconds: float = 0, archive=None):
+        self.file = RotatingFile(path, "events", "jsonl", max_bytes, rotate_seconds, archive)
+
+    def write(self, batch: list[tuple[str, dict]]):
+        lines = [json.dumps(record, ensure_ascii=False) + "\n" for kind, record in batch if kind == "event"]
+        if lines:
+            self.file.write("".join(lines))
+
+    def close(self):
+        self.file.close()
+
+
+class CsvSink:
+    # kind == "followup" 레코드를 CSV 한 행으로 append (기존 followup.csv 형식 그대로, 세그먼트마다 헤더)
+    def __init__(self, path: Path, fieldnames: list[str], max_bytes: int = 0, rotate_seconds: float = 0,
+                 archive=None):
+        self.fieldnames = fieldnames
+        self.file = RotatingFile(path, "followup", "csv", max_bytes, rotate_seconds, archive,
+                                 header=self._format([{f: f for f in fieldnames}]), newline="")
+
+    def _format(self, rows: list[dict]) -> str:
+        buf = io.StringIO()
+        w = csv.DictWriter(buf, fieldnames=self.fieldnames)
+        w.writerows(rows)
+        return buf.getvalue()
+
+    def write(self, batch: list[tuple[str, dict]]):
+        rows = [record for kind, record in batch if kind == "followup"]
+        if rows:
+            self.file.write(self._format(rows))
+
+    def close(self):
+        self.file.close()
+
+
+class FanoutSink:
+    # 한 batch를 여러 sink에 (각 sink는 자기 kind만 기록)
+    # sink 하나가 실패해도 나머지는 그대로 기록하고, 실패한 sink의 레코드는 보관했다가 다음 write 때
+    # 새 batch 앞에 붙여 다시 쓴다. 보관량이 max_pending을 넘을 때만 오래된 것부터 버린다(dropped).
+    def __init__(self, *sinks, max_pending: int = 100000):
+        self.sinks = sinks
+        self.max_pending = max_pending
+        self.pending: list[list] = [[] for _ in sinks]
+        self.dropped = 0
+
+    def pending_records(self) -> int:
+        return sum(len(p) for p in self.pending)
+
+    def write(self, batch: list[tuple[str, dict]]) -> bool:
+        # 모든 sink가 (밀린 것까지) 기록했으면 True
+        ok = True
+        for i, sink in enumerate(self.sinks):
+            records = self.pending[i] + batch if self.pending[i] else batch
+            if not records:
+                continue
+            try:
+                sink.write(records)
+                self.pending[i] = []
+            except Exception:
+                ok = False
+                over = len(records) - self.max_pending
+                if over > 0:
+                    self.dropped += over
+                    records = records[over:]
+                self.pending[i] = records
+        return ok
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+class LogWriter:
+    def __init__(self, sink, max_queue: int = 10000, flush_interval: float = 0.5, batch_size: int = 500,
+                 on_write=None, retry_interval: float = 5.0):
+        # 재시도는 FanoutSink가 sink별로 처리하므로 sink 하나여도 FanoutSink로 감싼다
+        self.sink = sink if isinstance(sink, FanoutSink) else FanoutSink(sink)
+        self.retry_interval = retry_interval
+        self.on_write = on_write  # (선택) on_write(초, 레코드 수): batch 기록 시간 측정용
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.thread: threading.Thread | None = None
+        self.lock = threading.Lock()
+        atexit.register(self.close)
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self.thread.start()
+
+    def submit(self, kind: str, record: dict, timeout: float = 0) -> bool:
+        # timeout > 0: 큐가 가득 차도 그만큼은 기다려서라도 넣는다 (잃으면 안 되는 레코드용)
+        if self.thread is None:
+            self.start()
+        try:
+            if timeout > 0:
+                self.queue.put((kind, record), timeout=timeout)
+            else:
+                self.queue.put_nowait((kind, record))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self, timeout: float | None = 5.0):
+        # 지금까지 넣은 레코드가 파일에 쓰일 때까지 대기
+        if self.thread is None:
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait(timeout)
+
+    def close(self, timeout: float | None = 10.0):
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is None:
+            return
+        self.queue.put(_STOP)
+        thread.join(timeout)
+        self.sink.close()
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped + self.sink.dropped,
+            "errors": self.errors,
+            "pending": self.sink.pending_records(),
+        }
+
+    def _write(self, batch: list):
+        if not batch and not self.sink.pending_records():
+            return
+        t0 = time.perf_counter()
+        if not self.sink.write(batch):
+            self.errors += 1
+        self.written += len(batch)
+        if self.on_write is not None:
+            self.on_write(time.perf_counter() - t0, len(batch))
+
+    def _run(self):
+        while True:
+            try:
+                # 밀린 레코드가 있으면 새 레코드가 없어도 retry_interval마다 다시 시도
+                item = self.queue.get(timeout=self.retry_interval if self.sink.pending_records() else None)
+            except queue.Empty:
+                self._write([])
+                continue
+            batch = []
+            waiters = []
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+            # 첫 레코드 이후 flush_interval 동안 또는 batch_size 만큼 모은다
+            while True:
+                if item is _STOP:
+                    stop = True
+                    break
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            self._write(batch)
+            for w in waiters:
+                w.set()
+            if stop:
+                # 종료 직전에 들어온 것까지 마저 기록
+                rest = []
+                while True:
+                    try:
+                        item = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if isinstance(item, threading.Event):
+                        item.set()
+                    elif item is not _STOP:
+                        rest.append(item)
+                self._write(rest)
+                return
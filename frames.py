@@ -0,0 +1,194 @@
+# =========================
+# 웹소켓 프레임 인코딩
+# =========================
+# 한 턴에 state/typing/ai 프레임이 5~7개 나가므로 JSON 직렬화 비용이 이벤트 루프에 그대로 쌓인다.
+# - orjson이 설치돼 있으면 그걸 쓰고, 없으면 표준 json (출력 형태는 같게: 공백 없음, 한글 그대로)
+# - 내용이 고정된 프레임은 import 시 한 번만 직렬화해 둔다
+# - state 프레임은 값이 그대로면 직전 문자열을 재사용한다
+# - (선택) 한 단계에서 나온 프레임들을 batch 프레임 하나로 묶어 보낸다
+# - 세션별 outbox가 보낸 프레임에 번호(seq)를 붙여 보관하고, 재접속(resume) 때 놓친 것만 다시 보낸다
+import asyncio
+import json
+import uuid
+from collections import deque
+
+try:
+    import orjson  # 선택 의존성 (pip install orjson)
+except ImportError:
+    orjson = None
+
+
+if orjson is not None:
+    def dumps(obj) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+
+    def loads(raw: str | bytes):
+        return orjson.loads(raw)
+else:
+    def dumps(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+    def loads(raw: str | bytes):
+        return json.loads(raw)
+
+
+def ai(text: str) -> str:
+    return dumps({"type": "ai", "text": text})
+
+
+def ai_delta(text: str) -> str:
+    return dumps({"type": "ai_delta", "text": text})
+
+
+def ai_done(text: str) -> str:
+    return dumps({"type": "ai_done", "text": text})
+
+
+def tick(remaining_seconds: int) -> str:
+    return dumps({"type": "tick", "remainingSeconds": remaining_seconds})
+
+
+def queued(position: int, eta: int) -> str:
+    return dumps({"type": "queued", "position": position, "etaSeconds": eta})
+
+
+TYPING_ON = dumps({"type": "typing", "on": True})
+TYPING_OFF = dumps({"type": "typing", "on": False})
+
+
+class StateFrame:
+    # 연결마다 하나. 마지막으로 보낸 (phase, 남은 질문, 남은 초)와 같으면 직렬화 생략
+    __slots__ = ("key", "text")
+
+    def __init__(self):
+        self.key = None
+        self.text = ""
+
+    def encode(self, phase: str, remaining_questions: int, remaining_seconds: int) -> str:
+        key = (phase, remaining_questions, remaining_seconds)
+        if key != self.key:
+            self.key = key
+            self.text = dumps({
+                "type": "state",
+                "phase": phase,
+                "remainingQuestions": remaining_questions,
+                "remainingSeconds": remaining_seconds,
+            })
+        return self.text
+
+
+_DELTA_PREFIX = '{"type":"ai_delta"'
+_DONE_MARK = '"type":"ai_done"'  # 문자열 값 안의 따옴표는 escape되므로 프레임 type에만 걸린다
+
+
+class Outbox:
+    # 세션(sid)마다 하나. 나가는 프레임마다 seq를 붙여 최근 max_frames개를 보관하고,
+    # 지금 붙어 있는 연결(sink)로 보낸다. 연결이 끊겨 보내기에 실패해도 생성은 계속되고
+    # 프레임은 남아 있으므로, 같은 sid로 다시 붙어 resume(lastSeq)을 보내면 그 뒤만 다시 보낸다.
+    # epoch: outbox마다 다른 id. 재시작/LRU 퇴출/다른 worker로 outbox가 새로 만들어지면 seq가 1부터 다시
+    # 시작하므로, 프레임과 resume에 epoch를 실어 클라이언트가 이전 lastSeq를 버리게 한다.
+    __slots__ = ("seq", "epoch", "frames", "deltas", "trimmed", "sink", "lock")
+
+    def __init__(self, max_frames: int = 512):
+        self.seq = 0
+        self.epoch = uuid.uuid4().hex[:12]
+        self.frames: deque[tuple[int, str, bool]] = deque(maxlen=max_frames)  # (seq, 텍스트, ai_delta 여부)
+        self.deltas = 0  # 보관 중인 ai_delta 프레임 수 (대략)
+        self.trimmed = 0  # 보관 한도 때문에 버린 마지막 seq (이보다 앞에서 resume하면 빠진 프레임이 있음)
+        self.sink = None  # 현재 연결의 send_text
+        self.lock = asyncio.Lock()  # 재전송과 실시간 전송 순서 보장
+
+    def record(self, text: str) -> str:
+        # 이미 직렬화된 '{"type":...}' 앞에 seq/epoch만 끼워 넣는다
+        self.seq += 1
+        delta = text.startswith(_DELTA_PREFIX)
+        if not delta and self.deltas and _DONE_MARK in text:
+            # 답변이 확정되면(ai_done에 전체 텍스트) 그 턴의 조각들은 다시 보낼 필요가 없다
+            self.frames = deque((f for f in self.frames if not f[2]), maxlen=self.frames.maxlen)
+            self.deltas = 0
+        text = f'{{"seq":{self.seq},"ep":"{self.epoch}",{text[1:]}'
+        if len(self.frames) == self.frames.maxlen:
+            self.trimmed = self.frames[0][0]
+        self.frames.append((self.seq, text, delta))
+        self.deltas += delta
+        return text
+
+    async def deliver(self, text: str):
+        async with self.lock:
+            sink = self.sink
+            if sink is None:
+                return
+            try:
+                await sink(text)
+            except Exception:
+                # 끊긴 연결: 프레임은 보관돼 있으므로 resume 때 다시 보낸다
+                if self.sink == sink:
+                    self.sink = None
+
+    def attach(self, sink):
+        self.sink = sink
+
+    def detach(self, sink):
+        if self.sink == sink:
+            self.sink = None
+
+    async def resume(self, sink, last_seq: int, epoch: str | None) -> tuple[int, bool, bool]:
+        # last_seq 뒤 프레임을 sink로 다시 보내고 sink를 붙인다. (보낸 개수, 보관분이 모자라 빠진 게 있는지, reset 여부)
+        # 클라이언트의 epoch가 이 outbox와 다르면 그 lastSeq는 다른 outbox 기준이므로 reset 프레임을 먼저 보내
+        # 클라이언트가 lastSeq를 0으로 되돌리게 하고 보관분 전체를 다시 보낸다.
+        async with self.lock:
+            reset = epoch != self.epoch
+            if reset:
+                last_seq = 0
+                await sink(dumps({"type": "reset", "ep": self.epoch}))
+            else:
+                while self.frames and self.frames[0][0] <= last_seq:
+                    self.frames.popleft()  # 클라이언트가 받았다고 확인한 것은 버림
+            gap = self.trimmed > last_seq
+            replay = [text for seq, text, _ in self.frames if seq > last_seq]
+            self.sink = sink
+            for text in replay:
+                await sink(text)
+        return len(replay), gap, reset
+
+
+class FrameSender:
+    # 연결마다 하나. batch=True면 send()한 프레임을 모아 두었다가 flush() 때 한 번에 보낸다.
+    # 이미 직렬화된 문자열을 그대로 이어 붙이므로 다시 인코딩하지 않는다.
+    # 바로 보여야 하는 프레임(typing on, queued, ai_delta)은 send_now()로 쌓인 것과 함께 즉시 보낸다.
+    # outbox가 있으면 실제 전송은 outbox를 거친다 (seq 부여 + 보관 + 현재 연결로 전달).
+    __slots__ = ("_send_text", "batch", "_pending", "outbox")
+
+    def __init__(self, send_text, batch: bool = False, outbox: Outbox | None = None):
+        self._send_text = send_text
+        self.batch = batch
+        self._pending: list[str] = []
+        self.outbox = outbox
+
+    async def _write(self, text: str):
+        if self.outbox is None:
+            await self._send_text(text)
+        else:
+            await self.outbox.deliver(self.outbox.record(text))
+
+    async def send(self, text: str):
+        if self.batch:
+            self._pending.append(text)
+        else:
+            await self._write(text)
+
+    async def send_now(self, text: str):
+        if self._pending:
+            self._pending.append(text)
+            await self.flush()
+        else:
+            await self._write(text)
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        if len(pending) == 1:
+            await self._write(pending[0])
+        else:
+            await self._write('{"type":"batch","frames":[' + ",".join(pending) + "]}")
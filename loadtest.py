@@ -0,0 +1,231 @@
+# =========================
+# 부하 테스트: 참가자 세션 N개를 /ws 에 동시에 흘려본다
+# =========================
+# 각 세션은 실제 프로토콜대로 hello -> user_message 3회(추천 질문에서 무작위) -> followup_answer -> 종료.
+#
+#   # 로컬 mock OpenAI + 서버를 같이 띄워서 측정 (네트워크/비용 없음)
+#   python loadtest.py --spawn --sessions 200 --ramp 10
+#   # 이미 떠 있는 서버에 대해
+#   python loadtest.py --url ws://127.0.0.1:8000/ws --sessions 50
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+
+import websockets
+
+from questions import MAX_QUESTIONS, QUESTIONS
+
+LABELS = [label for items in QUESTIONS.values() for _, label in items]
+ERROR_TEXT_PREFIX = "현재 응답 생성 과정에서 오류가 발생했습니다"
+
+
+@dataclass
+class Results:
+    connect: list[float] = field(default_factory=list)
+    first_token: list[float] = field(default_factory=list)
+    answer: list[float] = field(default_factory=list)
+    sessions_ok: int = 0
+    sessions_failed: int = 0
+    turns: int = 0
+    answer_errors: int = 0
+    queued_turns: int = 0
+    errors: dict[str, int] = field(default_factory=dict)
+
+    def error(self, kind: str):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+
+class Participant:
+    def __init__(self, url: str, timeout: float):
+        self.timeout = timeout
+        self.sid = str(uuid.uuid4())
+        self.url = f"{url}?sid={self.sid}"
+        self.ws = None
+        self.phase = "qa"
+        self.queued = False  # 이번 턴에 queued 프레임을 받았는지
+        self.pending: deque[dict] = deque()  # batch 프레임에서 풀어낸 나머지 프레임
+
+    async def recv(self) -> dict:
+        if not self.pending:
+            msg = json.loads(await asyncio.wait_for(self.ws.recv(), self.timeout))
+            # BATCH_FRAMES=1 서버는 여러 프레임을 batch 하나로 보낸다
+            self.pending.extend(msg["frames"] if msg.get("type") == "batch" else [msg])
+        msg = self.pending.popleft()
+        if msg.get("type") == "state":
+            self.phase = msg["phase"]
+        elif msg.get("type") == "queued":
+            self.queued = True
+        return msg
+
+    async def recv_until(self, pred) -> dict:
+        while True:
+            msg = await self.recv()
+            if pred(msg):
+                return msg
+
+    async def send(self, obj: dict):
+        await self.ws.send(json.dumps(obj, ensure_ascii=False))
+
+
+async def run_session(args, res: Results):
+    p = Participant(args.url, args.timeout)
+    think = lambda: asyncio.sleep(random.uniform(args.think_min, args.think_max))
+    try:
+        t0 = time.perf_counter()
+        p.ws = await asyncio.wait_for(websockets.connect(p.url, max_size=None), args.timeout)
+        res.connect.append(time.perf_counter() - t0)
+        async with p.ws:
+            await p.send({"type": "hello", "sid": p.sid})
+            await p.recv_until(lambda m: m["type"] == "state")
+
+            for _ in range(MAX_QUESTIONS):
+                await think()
+                t0 = time.perf_counter()
+                p.queued = False
+                await p.send({"type": "user_message", "sid": p.sid, "text": random.choice(LABELS)})
+                msg = await p.recv_until(lambda m: m["type"] in ("ai_delta", "ai_done", "ai"))
+                first = time.perf_counter() - t0
+                if msg["type"] == "ai_delta":
+                    msg = await p.recv_until(lambda m: m["type"] == "ai_done")
+                res.answer.append(time.perf_counter() - t0)
+                res.first_token.append(first)
+                res.turns += 1
+                res.queued_turns += p.queued
+                if msg["text"].startswith(ERROR_TEXT_PREFIX):
+                    res.answer_errors += 1
+                await p.recv_until(lambda m: m["type"] == "state")
+
+            # 3회째 답변 뒤 followup 안내까지 받고 마지막 답변 전송
+            if p.phase != "followup":
+                await p.recv_until(lambda m: m["type"] == "state" and m["phase"] == "followup")
+            await p.recv_until(lambda m: m["type"] == "ai")
+            await think()
+            await p.send({"type": "followup_answer", "sid": p.sid, "text": "부하 테스트 응답입니다."})
+            await p.recv_until(lambda m: m["type"] == "state" and m["phase"] == "done")
+        res.sessions_ok += 1
+    except asyncio.TimeoutError:
+        res.sessions_failed += 1
+        res.error("timeout")
+    except websockets.ConnectionClosed:
+        res.sessions_failed += 1
+        res.error("closed")
+    except OSError:
+        res.sessions_failed += 1
+        res.error("connect")
+
+
+def percentiles(values: list[float]) -> str:
+    if not values:
+        return "n/a"
+    v = sorted(values)
+    pick = lambda q: v[min(len(v) - 1, int(q * len(v)))] * 1000
+    return f"p50={pick(0.50):.0f}ms p90={pick(0.90):.0f}ms p99={pick(0.99):.0f}ms max={v[-1] * 1000:.0f}ms"
+
+
+def report(res: Results, elapsed: float, n: int):
+    print(f"sessions   : {res.sessions_ok}/{n} ok, {res.sessions_failed} failed {res.errors or ''}")
+    print(f"turns      : {res.turns} ({res.answer_errors} error answers, {res.queued_turns} queued)")
+    print(f"elapsed    : {elapsed:.1f}s  -> {res.turns / elapsed:.1f} turns/s, {res.sessions_ok / elapsed:.2f} sessions/s")
+    print(f"connect    : {percentiles(res.connect)}")
+    print(f"first token: {percentiles(res.first_token)}")
+    print(f"answer     : {percentiles(res.answer)}")
+
+
+async def run(args):
+    res = Results()
+    tasks = []
+    t0 = time.perf_counter()
+    for _ in range(args.sessions):
+        tasks.append(asyncio.create_task(run_session(args, res)))
+        if args.ramp > 0:
+            # ramp 초 동안 고르게 접속
+            await asyncio.sleep(args.ramp / args.sessions)
+    await asyncio.gather(*tasks)
+    report(res, time.perf_counter() - t0, args.sessions)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_port(port: int, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"port {port} did not open")
+
+
+def spawn(args) -> list[subprocess.Popen]:
+    # mock OpenAI 와 서버를 자식 프로세스로 띄움
+    here = os.path.dirname(os.path.abspath(__file__))
+    mock_port, app_port = _free_port(), _free_port()
+    mock = subprocess.Popen([sys.executable, "mock_openai.py", "--port", str(mock_port), *args.mock_args], cwd=here)
+    env = dict(
+        os.environ,
+        PORT=str(app_port),
+        OPENAI_BASE_URL=f"http://127.0.0.1:{mock_port}/v1",
+        OPENAI_API_KEY="mock",
+        CHIP_WARMUP="0",
+    )
+    if not args.keep_caches:
+        # 캐시가 답하면 생성 경로를 측정할 수 없으므로 기본은 끔
+        env["RESPONSE_CACHE"] = "0"
+        env["CHIP_CACHE"] = "0"
+    server = subprocess.Popen([sys.executable, "main.py"], cwd=here, env=env)
+    procs = [mock, server]
+    try:
+        _wait_port(mock_port)
+        _wait_port(app_port)
+    except Exception:
+        for proc in procs:
+            proc.terminate()
+        raise
+    args.url = f"ws://127.0.0.1:{app_port}/ws"
+    return procs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="simulate participant sessions against /ws")
+    parser.add_argument("--url", default="ws://127.0.0.1:8000/ws")
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which sessions connect")
+    parser.add_argument("--think-min", type=float, default=1.0, help="min think time between messages (s)")
+    parser.add_argument("--think-max", type=float, default=3.0, help="max think time between messages (s)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-frame receive timeout (s)")
+    parser.add_argument("--spawn", action="store_true", help="start mock_openai.py and main.py locally")
+    parser.add_argument("--keep-caches", action="store_true", help="with --spawn: leave answer caches on")
+    parser.add_argument("--mock-args", nargs=argparse.REMAINDER, default=[], help="extra args for mock_openai.py")
+    args = parser.parse_args()
+
+    procs = spawn(args) if args.spawn else []
+    try:
+        asyncio.run(run(args))
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                # terminate에 응답하지 않으면 강제 종료 (다음 실행이 포트를 못 잡는 일 방지)
+                proc.kill()
+                proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+# =========================
+# 로그 세그먼트 보관: 압축 + manifest + 보존 기간
+# =========================
+# events.jsonl / followup.csv 는 크기나 시간 기준으로 잘려(rotate) <이름>-<UTC 시각>-<pid>.<확장자> 세그먼트가 된다.
+# 여기서는 잘린 세그먼트를 백그라운드 스레드에서
+#   1) 한 번 훑어 레코드 수 / ts 범위를 구하고
+#   2) zstd(zstandard 설치 시) 또는 gzip으로 압축한 뒤
+#   3) manifest.json 에 기록하고, 보존 한도(일수/총 용량)를 넘는 오래된 세그먼트를 지운다.
+# 분석 도구는 manifest로 필요한 세그먼트만 골라 open_segment()로 읽으면 된다.
+import csv
+import gzip
+import io
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import zstandard  # 선택 의존성 (pip install zstandard)
+except ImportError:
+    zstandard = None
+
+try:
+    import fcntl  # 여러 worker가 같은 logs/ 를 쓸 때 rotate/manifest 갱신을 직렬화
+except ImportError:
+    fcntl = None
+
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = ".rotate.lock"
+_STOP = object()
+
+
+@contextmanager
+def dir_lock(directory: Path):
+    # 프로세스 간 lock (fcntl이 없는 환경에서는 단일 프로세스로 가정)
+    if fcntl is None:
+        yield
+        return
+    with open(directory / LOCK_NAME, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def segment_name(path: Path, ts: float) -> Path:
+    # <이름>-<UTC 시각(밀리초까지)>-<pid>[-n]<확장자>. 같은 밀리초에 또 잘리면 -1, -2 ... 를 붙여
+    # 이미 있는 세그먼트를 덮어쓰지 않는다 (dir_lock 안에서 호출)
+    stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime(ts)) + f"{int(ts * 1000) % 1000:03d}"
+    base = f"{path.stem}-{stamp}-{os.getpid()}"
+    candidate = path.with_name(f"{base}{path.suffix}")
+    n = 0
+    while any(candidate.with_name(candidate.name + ext).exists() for ext in ("", ".gz", ".zst")):
+        n += 1
+        candidate = path.with_name(f"{base}-{n}{path.suffix}")
+    return candidate
+
+
+def read_manifest(directory: Path) -> list[dict]:
+    try:
+        with open(directory / MANIFEST_NAME, encoding="utf-8") as f:
+            return json.load(f)["segments"]
+    except FileNotFoundError:
+        return []
+
+
+def _write_manifest(directory: Path, segments: list[dict]):
+    tmp = directory / f".{MANIFEST_NAME}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"segments": segments}, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, directory / MANIFEST_NAME)
+
+
+def open_segment(path: Path, newline: str | None = None):
+    # 압축 여부와 상관없이 텍스트로 연다
+    name = str(path)
+    if name.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline=newline)
+    if name.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"{path}: zstandard is not installed")
+        raw = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+        return io.TextIOWrapper(raw, encoding="utf-8", newline=newline)
+    return open(path, encoding="utf-8", newline=newline)
+
+
+def segments_for(directory: Path, kind: str, since: float | None = None, until: float | None = None) -> list[Path]:
+    # kind("events"/"followup") 세그먼트 중 시간 범위가 겹치는 것만, 오래된 순으로
+    # (sid는 UUID4라 범위로 좁힐 수 없으므로 세그먼트 단위로 거르지 않는다. 참가자별 조회는 logdb)
+    picked = []
+    for seg in read_manifest(directory):
+        if seg["kind"] != kind:
+            continue
+        if since is not None and seg["last_ts"] is not None and seg["last_ts"] < since:
+            continue
+        if until is not None and seg["first_ts"] is not None and seg["first_ts"] > until:
+            continue
+        picked.append(directory / seg["file"])
+    return picked
+
+
+def scan_segment(path: Path, fmt: str) -> dict:
+    # 레코드 수, ts 범위
+    n = 0
+    first_ts = last_ts = None
+    with open_segment(path, newline="" if fmt == "csv" else None) as f:
+        rows = csv.DictReader(f) if fmt == "csv" else (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            n += 1
+            try:
+                ts = float(row.get("ts"))
+            except (TypeError, ValueError):
+                ts = None
+            if ts is not None:
+                first_ts = ts if first_ts is None else min(first_ts, ts)
+                last_ts = ts if last_ts is None else max(last_ts, ts)
+    return {"records": n, "first_ts": first_ts, "last_ts": last_ts}
+
+
+def compress_file(path: Path, method: str) -> Path:
+    if method == "zstd":
+        target = path.with_name(path.name + ".zst")
+        tmp = target.with_name(f".{target.name}.tmp")
+        with open(path, "rb") as src, open(tmp, "wb") as dst:
+            zstandard.ZstdCompressor(level=10).copy_stream(src, dst)
+    else:
+        target = path.with_name(path.name + ".gz")
+        tmp = target.with_name(f".{target.name}.tmp")
+        with open(path, "rb") as src, gzip.open(tmp, "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.replace(tmp, target)
+    path.unlink()
+    return target
+
+
+class LogArchive:
+    def __init__(self, directory: Path, compression: str = "auto", retention_days: float = 0,
+                 retention_bytes: int = 0, grace_seconds: float = 2.0):
+        # compression: auto(zstd 있으면 zstd, 없으면 gzip) | zstd | gzip | none
+        # retention_*: 0이면 제한 없음 (연구 데이터라 기본은 지우지 않음)
+        self.directory = directory
+        if compression == "auto":
+            compression = "zstd" if zstandard is not None else "gzip"
+        if compression == "zstd" and zstandard is None:
+            compression = "gzip"
+        self.compression = compression
+        self.retention_days = retention_days
+        self.retention_bytes = retention_bytes
+        # 다른 worker가 rotate 직전에 잡고 있던 파일 핸들로 마저 쓸 수 있으므로 잠깐 기다렸다 압축
+        self.grace_seconds = grace_seconds
+        self.queue: queue.Queue = queue.Queue()
+        self.thread: threading.Thread | None = None
+        self.lock = threading.Lock()
+        self.archived = 0
+        self.errors = 0
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="log-archive", daemon=True)
+                self.thread.start()
+
+    def rotated(self, segment: Path, kind: str, fmt: str):
+        # RotatingFile이 세그먼트를 잘라낸 직후 호출 (로그 기록 스레드)
+        if self.thread is None:
+            self.start()
+        self.queue.put((time.monotonic() + self.grace_seconds, segment, kind, fmt))
+
+    def recover(self, patterns: dict[str, tuple[str, str]]):
+        # 기동 시: 이전 실행에서 잘렸지만 압축/manifest 기록이 안 된 세그먼트를 다시 처리
+        # patterns: {glob: (kind, fmt)}
+        # compression="none"이면 보관된 세그먼트도 이름이 그대로라 manifest에 있는 것은 건너뛴다
+        archived = {seg["file"] for seg in read_manifest(self.directory)}
+        for pattern, (kind, fmt) in patterns.items():
+            for segment in sorted(self.directory.glob(pattern)):
+                if segment.suffix in (".gz", ".zst") or segment.name.startswith(".") or segment.name in archived:
+                    continue
+                self.rotated(segment, kind, fmt)
+
+    def close(self, timeout: float | None = 5.0):
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is None:
+            return
+        # 남은 세그먼트는 다음 기동 때 recover()가 처리
+        self.queue.put(_STOP)
+        thread.join(timeout)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                return
+            ready_at, segment, kind, fmt = item
+            delay = ready_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                self._archive(segment, kind, fmt)
+                self.archived += 1
+            except FileNotFoundError:
+                pass  # 다른 worker가 먼저 처리함
+            except Exception:
+                self.errors += 1
+
+    def _archive(self, segment: Path, kind: str, fmt: str):
+        info = scan_segment(segment, fmt)
+        raw_bytes = segment.stat().st_size
+        stored = segment if self.compression == "none" else compress_file(segment, self.compression)
+        entry = {
+            "file": stored.name,
+            "kind": kind,
+            "format": fmt,
+            "compression": None if self.compression == "none" else self.compression,
+            "bytes": raw_bytes,
+            "stored_bytes": stored.stat().st_size,
+            "archived_at": time.time(),
+            **info,
+        }
+        with dir_lock(self.directory):
+            segments = [s for s in read_manifest(self.directory) if s["file"] != entry["file"]]
+            segments.append(entry)
+            segments.sort(key=lambda s: (s["first_ts"] or s["archived_at"], s["file"]))
+            segments = self._apply_retention(segments)
+            _write_manifest(self.directory, segments)
+
+    def _apply_retention(self, segments: list[dict]) -> list[dict]:
+        # 오래된 세그먼트부터 지운다 (manifest 순서 = 시간 순)
+        keep = list(segments)
+        if self.retention_days:
+            cutoff = time.time() - self.retention_days * 86400
+            while keep and (keep[0]["last_ts"] or keep[0]["archived_at"]) < cutoff:
+                self._remove(keep.pop(0))
+        if self.retention_bytes:
+            while keep and sum(s["stored_bytes"] for s in keep) > self.retention_bytes:
+                self._remove(keep.pop(0))
+        return keep
+
+    def _remove(self, seg: dict):
+        try:
+            (self.directory / seg["file"]).unlink()
+        except FileNotFoundError:
+            pass
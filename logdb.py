@@ -0,0 +1,146 @@
+# =========================
+# SQLite 이벤트/followup 저장소 (선택)
+# =========================
+# events.jsonl / followup.csv 대신(또는 함께) WAL 모드 SQLite 파일 하나에 기록한다.
+# LogWriter의 sink로 붙으므로 기록은 여전히 전용 스레드 하나가 batch 단위 트랜잭션으로 처리한다.
+# sid / event / ts 인덱스가 있어 참가자 한 명의 기록이나 최근 이벤트를 파일 전체를 훑지 않고 찾는다.
+# 이벤트는 JSONL에 쓰던 줄을 그대로(line) 저장하므로 export 결과는 기존 파일과 바이트 단위로 같다.
+#
+#   python logdb.py events [--sid SID] [--since TS] [--until TS] [-o events.jsonl]
+#   python logdb.py followups [--sid SID] [-o followup.csv]
+import argparse
+import csv
+import io
+import json
+import sqlite3
+import sys
+from pathlib import Path
+
+FOLLOWUP_FIELDS = ["ts", "sid", "ip", "text"]
+
+
+def connect(path: Path) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(path, timeout=10.0, isolation_level=None, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS events ("
+        " id INTEGER PRIMARY KEY, ts REAL, sid TEXT, event TEXT, line TEXT NOT NULL)"
+    )
+    db.execute("CREATE INDEX IF NOT EXISTS events_sid ON events (sid, ts)")
+    db.execute("CREATE INDEX IF NOT EXISTS events_event ON events (event, ts)")
+    db.execute("CREATE INDEX IF NOT EXISTS events_ts ON events (ts)")
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS followups ("
+        " id INTEGER PRIMARY KEY, ts REAL, sid TEXT, ip TEXT, text TEXT)"
+    )
+    db.execute("CREATE INDEX IF NOT EXISTS followups_sid ON followups (sid)")
+    db.execute("CREATE INDEX IF NOT EXISTS followups_ts ON followups (ts)")
+    return db
+
+
+class SqliteSink:
+    # LogWriter sink: "event" / "followup" 레코드를 batch 하나당 트랜잭션 하나로 기록
+    def __init__(self, path: Path):
+        self.path = path
+        self.db = None  # 첫 batch 때 기록 스레드에서 연다
+
+    def write(self, batch: list[tuple[str, dict]]):
+        if self.db is None:
+            self.db = connect(self.path)
+        events = []
+        followups = []
+        for kind, record in batch:
+            if kind == "event":
+                # JsonlSink와 같은 직렬화 (export가 기존 파일과 똑같이 나오도록)
+                line = json.dumps(record, ensure_ascii=False)
+                events.append((record.get("ts"), record.get("sid"), record.get("event"), line))
+            elif kind == "followup":
+                followups.append(tuple(record.get(f) for f in FOLLOWUP_FIELDS))
+        if not events and not followups:
+            return
+        self.db.execute("BEGIN IMMEDIATE")  # 다른 worker와 쓰기 순서 직렬화
+        try:
+            if events:
+                self.db.executemany("INSERT INTO events (ts, sid, event, line) VALUES (?, ?, ?, ?)", events)
+            if followups:
+                self.db.executemany("INSERT INTO followups (ts, sid, ip, text) VALUES (?, ?, ?, ?)", followups)
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+
+def _where(sid: str | None, since: float | None, until: float | None, event: str | None = None):
+    clauses, params = [], []
+    for column, op, value in (("sid", "=", sid), ("event", "=", event), ("ts", ">=", since), ("ts", "<=", until)):
+        if value is not None:
+            clauses.append(f"{column} {op} ?")
+            params.append(value)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+def iter_events(db: sqlite3.Connection, sid: str | None = None, since: float | None = None,
+                until: float | None = None, event: str | None = None):
+    # 기록된 순서(id)대로 JSONL 한 줄씩 (줄바꿈 포함)
+    where, params = _where(sid, since, until, event)
+    for (line,) in db.execute(f"SELECT line FROM events{where} ORDER BY id", params):
+        yield line + "\n"
+
+
+def iter_followups(db: sqlite3.Connection, sid: str | None = None, since: float | None = None,
+                   until: float | None = None):
+    # CsvSink와 같은 형식: 헤더 한 줄 + 행 (csv 기본 dialect, \r\n)
+    where, params = _where(sid, since, until)
+    buf = io.StringIO()
+    w = csv.DictWriter(buf, fieldnames=FOLLOWUP_FIELDS)
+    w.writeheader()
+    rows = db.execute(f"SELECT ts, sid, ip, text FROM followups{where} ORDER BY id", params)
+    while True:
+        chunk = rows.fetchmany(1000)
+        w.writerows(dict(zip(FOLLOWUP_FIELDS, row)) for row in chunk)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+        if not chunk:
+            return
+
+
+def main():
+    parser = argparse.ArgumentParser(description="export events/followups from the SQLite log store")
+    parser.add_argument("--db", default="logs/events.sqlite")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    for name, help_text in (("events", "export events as JSONL"), ("followups", "export followups as CSV")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--sid")
+        p.add_argument("--since", type=float, help="unix ts (inclusive)")
+        p.add_argument("--until", type=float, help="unix ts (inclusive)")
+        p.add_argument("-o", "--out", help="output file (default: stdout)")
+        if name == "events":
+            p.add_argument("--event", help="only this event type")
+    args = parser.parse_args()
+
+    db = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    if args.cmd == "events":
+        chunks = iter_events(db, args.sid, args.since, args.until, args.event)
+    else:
+        chunks = iter_followups(db, args.sid, args.since, args.until)
+    # 줄바꿈 변환 없이 그대로 (CSV는 \r\n)
+    out = open(args.out, "wb") if args.out else sys.stdout.buffer
+    try:
+        for text in chunks:
+            out.write(text.encode("utf-8"))
+    finally:
+        if args.out:
+            out.close()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,47 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
+from contextlib import asynccontextmanager
+from collections import OrderedDict
 from pathlib import Path
+import hmac
 import json
 import time
 import os
-import csv
 import asyncio
+import sys
 
 # OpenAI (server-side only)
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI
+
+from answer_cache import ChipAnswerStore, ResponseCache
+from clock import SessionClock
+from dashboard import ADMIN_HTML, EventBus, LiveStats
+from eventlog import CsvSink, FanoutSink, JsonlSink, LogWriter
+from logarchive import LogArchive
+from logdb import FOLLOWUP_FIELDS, SqliteSink
+import frames
+from metrics import Registry
+from profiling import Profiler
+from prompt import PromptPrefix, count_tokens, history_token_budget
+from questions import MAX_QUESTIONS, QUESTIONS
+from resilience import RetryPolicy, TtftWindow, resilient_stream
+from scheduler import GenerationScheduler
+from sessions import Session, make_session_store
+from webassets import HTML_CACHE_CONTROL, PrecompressedAsset, split_inline_assets
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await on_startup()
+    try:
+        yield
+    finally:
+        await on_shutdown()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # Avatar config (env-based)
@@ -19,9 +49,8 @@ AVATAR_MODE = os.environ.get("AVATAR_MODE", "pink")  # pink | photo
 AVATAR_URL = os.environ.get("AVATAR_URL", "/static/spokesperson_profile.jpeg")
 
 # =========================
-# 0) 실험 설정
+# 0) 실험 설정 (질문 횟수 MAX_QUESTIONS 는 questions.py)
 # =========================
-MAX_QUESTIONS = 3
 TIME_LIMIT_SECONDS = 3 * 60  # 3분
 FOLLOWUP_CSV_NAME = "followup.csv"
 
@@ -47,34 +76,100 @@ INCIDENT_FACTS = """
 - 본 사고로 인한 서비스 중단은 발생하지 않음
 """.strip()
 
-client = OpenAI()  # OPENAI_API_KEY 환경변수 사용
+# 동시 GPT 호출 상한 + 공유 HTTP 커넥션 풀 설정
+GPT_MAX_CONCURRENCY = int(os.environ.get("GPT_MAX_CONCURRENCY", "256"))
+# 분당 토큰 예산 (prompt + completion, 0이면 제한 없음). 넘으면 요청은 대기열에서 기다린다.
+GPT_TOKENS_PER_MINUTE = int(os.environ.get("GPT_TOKENS_PER_MINUTE", "0"))
+# 대기열 입장 시 completion 토큰 추정치 (실제 usage가 오면 바로잡음)
+GPT_EXPECTED_COMPLETION_TOKENS = int(os.environ.get("GPT_EXPECTED_COMPLETION_TOKENS", "400"))
+GPT_HTTP_MAX_CONNECTIONS = int(os.environ.get("GPT_HTTP_MAX_CONNECTIONS", str(GPT_MAX_CONCURRENCY)))
+GPT_HTTP_MAX_KEEPALIVE = int(os.environ.get("GPT_HTTP_MAX_KEEPALIVE", "64"))
+GPT_TIMEOUT_SECONDS = float(os.environ.get("GPT_TIMEOUT_SECONDS", "60"))
+# 재시도/hedging (SDK 자체 재시도는 끄고 여기서 세션 남은 시간 안에서만 시도)
+GPT_RETRY_POLICY = RetryPolicy(
+    retries=int(os.environ.get("GPT_RETRIES", "2")),
+    hedge=os.environ.get("GPT_HEDGE", "0") == "1",
+    hedge_percentile=float(os.environ.get("GPT_HEDGE_PERCENTILE", "0.95")),
+)
+# 세션 남은 시간에서 이만큼은 남겨두고 생성을 끊는다 (오류 안내/상태 전송 여유)
+GPT_DEADLINE_MARGIN_SECONDS = float(os.environ.get("GPT_DEADLINE_MARGIN_SECONDS", "5"))
+# GPT에 넘기는 history 토큰 상한 (모델별 기본값, HISTORY_TOKEN_BUDGET으로 덮어쓰기)
+HISTORY_TOKEN_BUDGET = history_token_budget(MODEL_NAME, os.environ.get("HISTORY_TOKEN_BUDGET"))
+# 1이면 답변을 토큰 단위로 ai_delta/ai_done 프레임으로 흘려보냄 (0이면 기존처럼 ai 한 번)
+STREAM_ANSWERS = os.environ.get("STREAM_ANSWERS", "1") == "1"
+# 1이면 한 단계(메시지 처리 한 번)에서 나온 typing/ai/state 프레임을 batch 프레임 하나로 묶어 보냄
+BATCH_FRAMES = os.environ.get("BATCH_FRAMES", "0") == "1"
 
 
 # =========================
-# 1) UI에 보여줄 추천 질문(프론트용)
-# =========================``
-QUESTIONS = {
-    "사고 원인": [
-        ("q1", "사고 발생 경위가 어떻게 되나요?"),
-        ("q2", "발생 시점은 언제인가요?"),
-        ("q3", "영향 범위(유출된 정보)는 무엇인가요?"),
-    ],
-    "사고 대응": [
-        ("q4", "사고 이후 회사가 한 조치는 무엇인가요?"),
-        ("q5", "현재 서비스는 정상 운영 중인가요?"),
-        ("q6", "정부/외부기관과 협력은 어떻게 진행되나요?"),
-    ],
-    "보상 체계": [
-        ("q7", "사용자가 지금 당장 해야 할 조치는 뭔가요?"),
-        ("q8", "개별 문의/지원은 어디로 하면 되나요?"),
-        ("q9", "내 정보 유출 여부는 어떻게 확인하나요?"),
-    ],
-    "예방 및 미래 계획": [
-        ("q10", "재발 방지 계획은 무엇인가요?"),
-        ("q11", "추가 업데이트는 어디서 확인하나요?"),
-        ("q12", "사고 수습 예상 완료 시점은요?"),
-    ],
-}
+# 1) UI에 보여줄 추천 질문(프론트용) — questions.py (loadtest.py와 공유)
+# =========================
+CHIP_LABELS = {label for items in QUESTIONS.values() for _, label in items}
+
+# =========================
+# 1-1) 메트릭 (/metrics)
+# =========================
+METRICS = Registry()
+WS_MESSAGE_TYPES = {"hello", "resume", "start", "user_message", "followup_answer", "exit"}
+# 채팅 시작(시간 제한 시작)으로 보는 메시지. start를 못 받았어도 질문이 오면 그때부터 잰다
+CHAT_START_TYPES = {"start", "user_message", "followup_answer"}
+# 현재 열린 웹소켓 -> 세션 (phase별 활성 세션 수 계산용)
+ACTIVE_CONNECTIONS: dict[int, "Session"] = {}
+
+def _active_by_phase() -> dict[tuple, int]:
+    counts: dict[tuple, int] = {}
+    for s in list(ACTIVE_CONNECTIONS.values()):
+        counts[(s.phase,)] = counts.get((s.phase,), 0) + 1
+    return counts
+
+def _threadpool_queue_depth() -> dict[tuple, int]:
+    # 이벤트 루프 기본 executor(asyncio.to_thread 등)에 쌓인 작업 수
+    executor = getattr(asyncio.get_running_loop(), "_default_executor", None)
+    work_queue = getattr(executor, "_work_queue", None)
+    return {(): work_queue.qsize() if work_queue is not None else 0}
+
+GPT_ANSWER_SECONDS = METRICS.histogram("gpt_answer_seconds", "Time to produce a full answer", ("cache",))
+GPT_IN_FLIGHT = METRICS.gauge("gpt_in_flight", "Upstream generations currently running")
+GPT_QUEUE_WAIT_SECONDS = METRICS.histogram("gpt_queue_wait_seconds", "Time spent waiting for a generation slot")
+METRICS.gauge(
+    "gpt_scheduler", "Generation scheduler state", ("stat",),
+    fn=lambda: {(k,): v for k, v in GPT_SCHEDULER.stats().items()},
+)
+TURN_STAGE_SECONDS = METRICS.histogram("turn_stage_seconds", "Per-turn time by stage (see turn_timing events)", ("stage",))
+GPT_TTFT_SECONDS = METRICS.histogram(
+    "gpt_ttft_seconds", "Time to first upstream token by provider prompt cache use", ("prompt_cache",)
+)
+PROMPT_TOKENS = METRICS.counter("openai_prompt_tokens_total", "Prompt tokens sent upstream")
+CACHED_PROMPT_TOKENS = METRICS.counter("openai_cached_prompt_tokens_total", "Prompt tokens served from the provider prompt cache")
+COMPLETION_TOKENS = METRICS.counter("openai_completion_tokens_total", "Completion tokens received")
+GPT_RETRIES = METRICS.counter("gpt_retries_total", "Upstream retries after 429/5xx/connection errors")
+GPT_HEDGES = METRICS.counter("gpt_hedged_total", "Turns where a hedge request was sent")
+GPT_ATTEMPT_WINS = METRICS.counter("gpt_attempt_wins_total", "Which attempt produced the answer", ("attempt",))
+OPENAI_ERRORS = METRICS.counter("openai_errors_total", "Failed generations by exception type", ("type",))
+WS_CONNECTS = METRICS.counter("ws_connections_total", "Accepted websocket connections")
+WS_MESSAGES = METRICS.counter("ws_messages_total", "Websocket messages received by type", ("mtype",))
+METRICS.gauge("sessions_active", "Connected sessions by phase", ("phase",), fn=_active_by_phase)
+METRICS.gauge("sessions_stored", "Sessions held by the session store", fn=lambda: {(): SESSION_STATS["live"]})
+METRICS.gauge("sessions_clock", "Connections tracked by the session clock", fn=lambda: {(): len(SESSION_CLOCK)})
+METRICS.gauge("sessions_expired_by_clock", "Connections closed by the session clock", fn=lambda: {(): SESSION_CLOCK.expired_total})
+METRICS.gauge("sessions_evicted", "Sessions evicted by this process", fn=lambda: {(): SESSION_STATS["evicted"]})
+LOG_WRITE_SECONDS = METRICS.histogram("log_write_seconds", "Time to write one batch of log records")
+METRICS.gauge("log_queue_depth", "Log records waiting to be written", fn=lambda: {(): LOG_WRITER.stats()["queue_depth"]})
+METRICS.gauge("log_dropped", "Log records dropped because the queue or retry buffer was full", fn=lambda: {(): LOG_WRITER.stats()["dropped"]})
+METRICS.gauge("log_pending", "Log records kept for retry after a sink write failed", fn=lambda: {(): LOG_WRITER.stats()["pending"]})
+METRICS.gauge("log_segments_archived", "Rotated log segments compressed and added to the manifest", fn=lambda: {(): LOG_ARCHIVE.archived})
+METRICS.gauge("threadpool_queue_depth", "Work items queued on the default executor", fn=_threadpool_queue_depth)
+METRICS.gauge(
+    "response_cache", "Response cache counters", ("stat",),
+    fn=lambda: {(k,): v for k, v in RESPONSE_CACHE.stats().items()},
+)
+
+# 구간 프로파일러 (기본 꺼짐): PROFILE=1 또는 POST /admin/profile/start 로 켠다.
+# 결과는 GET /admin/profile (구간별 히스토그램), /admin/profile/collapsed (flame graph 입력)
+PROFILER = Profiler(
+    lag_interval=float(os.environ.get("PROFILE_LAG_INTERVAL", "0.1")),
+    pool_depth=lambda: _threadpool_queue_depth()[()],
+)
 
 # =========================
 # 2) 로그(JSONL) + Followup CSV
@@ -84,67 +179,332 @@ LOG_DIR.mkdir(exist_ok=True)
 LOG_FILE = LOG_DIR / "events.jsonl"
 FOLLOWUP_CSV = LOG_DIR / FOLLOWUP_CSV_NAME
 
-def log_event(event: dict):
-    event.setdefault("ts", time.time())
-    with LOG_FILE.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(event, ensure_ascii=False) + "\n")
+# 잘린 세그먼트 압축(zstd/gzip) + manifest.json + 보존 한도 (0이면 지우지 않음)
+LOG_ARCHIVE = LogArchive(
+    LOG_DIR,
+    compression=os.environ.get("LOG_COMPRESSION", "auto"),  # auto | zstd | gzip | none
+    retention_days=float(os.environ.get("LOG_RETENTION_DAYS", "0")),
+    retention_bytes=int(os.environ.get("LOG_RETENTION_BYTES", "0")),
+)
+# 파일 크기/시간 기준 rotate (0이면 해당 기준 없음). 기본: 64MB 또는 하루(UTC)
+LOG_ROTATE_BYTES = int(os.environ.get("LOG_ROTATE_BYTES", str(64 * 1024 * 1024)))
+LOG_ROTATE_SECONDS = float(os.environ.get("LOG_ROTATE_SECONDS", "86400"))
+
+# 기록 대상: files(events.jsonl + followup.csv) | sqlite(WAL 모드 DB, sid/event/ts 인덱스) | both
+# sqlite에서 기존 형식 파일이 필요하면 `python logdb.py events|followups` 로 export
+LOG_BACKEND = os.environ.get("LOG_BACKEND", "files")
+LOG_DB_PATH = Path(os.environ.get("LOG_DB_PATH", str(LOG_DIR / "events.sqlite")))
+if LOG_BACKEND not in ("files", "sqlite", "both"):
+    raise ValueError(f"unknown LOG_BACKEND: {LOG_BACKEND}")
+LOG_SINKS = []
+if LOG_BACKEND in ("files", "both"):
+    LOG_SINKS.append(JsonlSink(LOG_FILE, LOG_ROTATE_BYTES, LOG_ROTATE_SECONDS, LOG_ARCHIVE))
+    LOG_SINKS.append(CsvSink(FOLLOWUP_CSV, FOLLOWUP_FIELDS, LOG_ROTATE_BYTES, LOG_ROTATE_SECONDS, LOG_ARCHIVE))
+if LOG_BACKEND in ("sqlite", "both"):
+    LOG_SINKS.append(SqliteSink(LOG_DB_PATH))
+
+# 이벤트 로그와 followup은 전용 스레드가 모아서 기록 (이벤트 루프에서 파일 I/O 안 함)
+LOG_WRITER = LogWriter(
+    FanoutSink(*LOG_SINKS),
+    max_queue=int(os.environ.get("LOG_QUEUE_MAX", "10000")),
+    flush_interval=float(os.environ.get("LOG_FLUSH_INTERVAL", "0.5")),
+    batch_size=int(os.environ.get("LOG_BATCH_SIZE", "500")),
+    on_write=lambda seconds, n: LOG_WRITE_SECONDS.observe(seconds),
+)
+
+# 같은 이벤트를 프로세스 안에서도 구독할 수 있게 (관리자 대시보드 실시간 집계)
+EVENT_BUS = EventBus()
+LIVE_STATS = LiveStats()
+EVENT_BUS.subscribe(LIVE_STATS.on_event)
 
-def log_followup(ts: float, sid: str, ip: str | None, text: str):
-    is_new = not FOLLOWUP_CSV.exists()
-    with FOLLOWUP_CSV.open("a", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=["ts", "sid", "ip", "text"])
-        if is_new:
-            w.writeheader()
-        w.writerow({"ts": ts, "sid": sid, "ip": ip, "text": text})
+def log_event(event: dict):
+    with PROFILER.stage("log_event"):
+        event.setdefault("ts", time.time())
+        LOG_WRITER.submit("event", event)
+        EVENT_BUS.publish(event)
+
+async def log_followup(ts: float, sid: str, ip: str | None, text: str):
+    # followup은 잃으면 안 되므로 큐가 가득 차도 잠깐 기다려서 넣는다
+    # (기다리는 동안 이벤트 루프를 막지 않도록 스레드에서. 세션당 한 번뿐이라 비용은 작다)
+    await asyncio.to_thread(LOG_WRITER.submit, "followup", {"ts": ts, "sid": sid, "ip": ip, "text": text}, 1.0)
+
+def log_turn_timing(sid: str, turn: int, source: str, stages: dict, usage: dict):
+    # 한 턴이 어디서 시간을 썼는지 (초). source: gpt | chip_cache | response_cache | error
+    # receive: 메시지 수신~생성 시작(파싱, 질문 예약, typing), queue_wait/connect/ttft/generation: 업스트림 쪽,
+    # send: 프레임 전송에 걸린 시간, total: 수신~전송 완료. 해당 없는 단계는 null
+    record = {"event": "turn_timing", "sid": sid, "turn": turn, "source": source}
+    for stage, seconds in stages.items():
+        record[stage] = None if seconds is None else round(seconds, 4)
+        if seconds is not None:
+            TURN_STAGE_SECONDS.observe(seconds, stage)
+    record["prompt_tokens"] = usage.get("prompt_tokens")
+    record["completion_tokens"] = usage.get("completion_tokens")
+    log_event(record)
 
 
 # =========================
 # 3) 세션 상태(서버 메모리)
 # =========================
-SESSIONS: dict[str, dict] = {}
-# sid -> {
-#   "start_ts": float,
-#   "count": int,
-#   "phase": "qa" | "followup" | "done",
-#   "history": list[dict],  # (선택) GPT 문맥용
-# }
-
-def get_session(sid: str):
-    s = SESSIONS.get(sid)
-    if not s:
-        s = {
-            "start_ts": time.time(),
-            "count": 0,
-            "phase": "qa",
-            "history": []
-        }
-        SESSIONS[sid] = s
-    return s
-
-def remaining_time(s):
-    return max(0, int(TIME_LIMIT_SECONDS - (time.time() - s["start_ts"])))
+# 마지막 접근 뒤 시간 제한 + grace 동안 보관했다가 (재접속 대비) 만료 순서대로 버린다.
+SESSION_GRACE_SECONDS = int(os.environ.get("SESSION_GRACE_SECONDS", "3600"))
+# worker가 여러 개면 sqlite 또는 socket 으로 세션을 공유해야 한다
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "memory")  # memory | sqlite | socket
+SESSIONS = make_session_store(
+    SESSION_BACKEND,
+    ttl_seconds=TIME_LIMIT_SECONDS + SESSION_GRACE_SECONDS,
+    sqlite_path=Path(os.environ.get("SESSION_DB", "sessions.sqlite")),
+    address=os.environ.get("SESSION_SERVER", "127.0.0.1:8765"),
+)
+
+# sqlite/socket 저장소 호출은 blocking I/O(쓰기 잠금 대기 최대 10초, 소켓 왕복)이므로
+# 이벤트 루프를 막지 않도록 스레드에서 부른다. memory는 dict 조작뿐이라 그대로.
+SESSION_IO_IN_THREAD = SESSION_BACKEND != "memory"
+# /metrics 는 저장소를 직접 조회하지 않고 주기적으로 갱신한 값을 쓴다
+SESSION_STATS_INTERVAL = float(os.environ.get("SESSION_STATS_INTERVAL", "10"))
+SESSION_STATS = {"live": 0, "created": 0, "evicted": 0}
+
+async def _session_io(fn, *args, **kwargs):
+    if SESSION_IO_IN_THREAD:
+        return await asyncio.to_thread(fn, *args, **kwargs)
+    return fn(*args, **kwargs)
+
+async def get_session(sid: str) -> Session:
+    return await _session_io(SESSIONS.get, sid)
+
+async def reserve_question(s: Session, limit: int) -> bool:
+    return await _session_io(SESSIONS.reserve_question, s, limit)
+
+async def set_phase(s: Session, phase: str, expected: str | None = None) -> bool:
+    return await _session_io(SESSIONS.set_phase, s, phase, expected)
+
+async def start_chat(s: Session) -> bool:
+    return await _session_io(SESSIONS.start_chat, s)
+
+async def refresh_session_stats():
+    while True:
+        try:
+            SESSION_STATS.update(await _session_io(SESSIONS.stats))
+        except Exception:
+            pass
+        await asyncio.sleep(SESSION_STATS_INTERVAL)
+
+def remaining_time(s: Session):
+    # 안내(priming) 화면에 있는 동안은 시간이 가지 않는다 (채팅 시작 시각부터 TIME_LIMIT_SECONDS)
+    if s.chat_ts is None:
+        return TIME_LIMIT_SECONDS
+    return max(0, int(TIME_LIMIT_SECONDS - (time.time() - s.chat_ts)))
+
+# 세션별 보낸 프레임 보관함 (재접속 시 resume으로 놓친 프레임만 다시 보냄). 프로세스 메모리에만 있으므로
+# worker가 여러 개면 같은 sid가 같은 worker로 가야(sticky) 이어받을 수 있다.
+OUTBOX_MAX_FRAMES = int(os.environ.get("OUTBOX_MAX_FRAMES", "512"))
+OUTBOX_MAX_SESSIONS = int(os.environ.get("OUTBOX_MAX_SESSIONS", "10000"))
+OUTBOXES: "OrderedDict[str, frames.Outbox]" = OrderedDict()
+
+# 모든 연결의 시간 종료/동기화 tick을 task 하나로 처리 (CLOCK_TICK_SECONDS=0 이면 tick 없음)
+CLOCK_TICK_SECONDS = float(os.environ.get("CLOCK_TICK_SECONDS", "10"))
+SESSION_CLOCK = SessionClock(CLOCK_TICK_SECONDS)
+
+def get_outbox(sid: str) -> frames.Outbox:
+    outbox = OUTBOXES.get(sid)
+    if outbox is None:
+        outbox = OUTBOXES[sid] = frames.Outbox(OUTBOX_MAX_FRAMES)
+        while len(OUTBOXES) > OUTBOX_MAX_SESSIONS:
+            OUTBOXES.popitem(last=False)
+    else:
+        OUTBOXES.move_to_end(sid)
+    return outbox
 
 
 # =========================
 # 4) GPT 호출(서버)
 # =========================
-def ask_gpt(user_text: str, history: list[dict]) -> str:
-    # 너무 길어질 경우를 대비해 history를 적당히 제한(최근 n개만)
-    trimmed = history[-10:] if history else []
-
-    messages = [
-        {"role": "system", "content": SYSTEM_PROMPT},
-        {"role": "system", "content": INCIDENT_FACTS},
-    ]
-    messages.extend(trimmed)
-    messages.append({"role": "user", "content": user_text})
-
-    resp = client.chat.completions.create(
+_client: AsyncOpenAI | None = None
+# 동시 호출 수/분당 토큰을 넘지 않게 세션 종료 시각 순으로 들여보내는 전역 대기열
+GPT_SCHEDULER = GenerationScheduler(GPT_MAX_CONCURRENCY, GPT_TOKENS_PER_MINUTE)
+
+def get_client() -> AsyncOpenAI:
+    # 프로세스 전체가 하나의 AsyncOpenAI(= 하나의 커넥션 풀)를 공유한다.
+    # import 시점이 아니라 첫 호출 때 만든다. (OPENAI_API_KEY 환경변수 사용)
+    global _client
+    if _client is None:
+        _client = AsyncOpenAI(
+            max_retries=0,  # 재시도는 resilient_stream이 deadline 안에서 처리
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=GPT_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=GPT_HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=30.0,
+                ),
+                timeout=httpx.Timeout(GPT_TIMEOUT_SECONDS, connect=5.0),
+            ),
+        )
+    return _client
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+def history_message(role: str, content: str) -> dict:
+    # history에 들어갈 때 토큰 수를 한 번만 세어 같이 저장
+    return {"role": role, "content": content, "tokens": count_tokens(content, MODEL_NAME)}
+
+async def append_history(s: Session, role: str, content: str):
+    await _session_io(SESSIONS.append_history, s, history_message(role, content), token_budget=HISTORY_TOKEN_BUDGET)
+
+def trim_history(s: Session) -> list[dict]:
+    # 토큰 예산(HISTORY_TOKEN_BUDGET) 안에 드는 최근 history (창은 append 때 조금씩 밀려 있음)
+    # 예산보다 큰 질문은 ws_endpoint에서 받지 않으므로, 이번 질문까지 포함한 창이 예산 안에 든다
+    # (예산보다 긴 답변은 창에 혼자 남았다가 다음 질문이 들어올 때 밀려난다)
+    return s.history[s.history_start:]
+
+# 고정 prefix는 기동 시 한 번만 만들어 모든 요청에서 같은 바이트로 재사용 (prompt caching 용)
+PROMPT_PREFIX = PromptPrefix(SYSTEM_PROMPT, INCIDENT_FACTS, MODEL_NAME)
+
+def build_messages(user_text: str, history: list[dict]) -> list[dict]:
+    # history: 이번 질문 이전까지의 대화 (질문 자체는 넣지 않는다)
+    return PROMPT_PREFIX.build(history, user_text)
+
+TTFT_WINDOW = TtftWindow()
+
+def estimate_tokens(user_text: str, history: list[dict]) -> int:
+    # 대기열 입장용 추정치: prefix + history + 질문 + 예상 completion
+    history_tokens = sum(m.get("tokens") or count_tokens(m["content"], MODEL_NAME) for m in history)
+    return PROMPT_PREFIX.tokens + history_tokens + count_tokens(user_text, MODEL_NAME) + GPT_EXPECTED_COMPLETION_TOKENS
+
+async def ask_gpt_stream(user_text: str, history: list[dict], usage: dict | None = None,
+                         deadline: float | None = None, info: dict | None = None,
+                         priority: float = float("inf"), on_queued=None, timing: dict | None = None):
+    # 답변 조각(delta)을 도착하는 대로 yield. usage를 넘기면 토큰 사용량(cached 포함)을,
+    # info를 넘기면 몇 번째 시도가 채택됐는지(재시도/hedge)와 대기열 대기 시간을 채워준다.
+    # timing을 넘기면 채택된 시도의 connect/ttft와 슬롯 입장 후 전체 생성 시간(generation, 초)을 채워준다.
+    # deadline은 loop.time() 기준 절대 시각 (없으면 GPT_TIMEOUT_SECONDS 뒤)
+    # priority는 대기열 순서 (작을수록 먼저, 보통 세션 종료 시각), on_queued(position, eta)는 대기 중 알림
+    messages = build_messages(user_text, history)
+    loop = asyncio.get_running_loop()
+    if deadline is None:
+        deadline = loop.time() + GPT_TIMEOUT_SECONDS
+    info = {} if info is None else info
+    usages: dict[int, dict] = {}
+    timings: dict[int, dict] = {}
+
+    def attempt(n: int):
+        usages[n] = {}
+        timings[n] = {}
+        return _stream_completion(messages, usages[n], timings[n])
+
+    def record_queue_wait():
+        # 입장했을 때, 또는 입장 못 하고 끝났을 때(QueueTimeout, 취소) 한 번만 기록
+        if "queue_wait" not in info:
+            info["queue_wait"] = round(loop.time() - t_queue, 3)
+            GPT_QUEUE_WAIT_SECONDS.observe(info["queue_wait"])
+
+    t_queue = loop.time()
+    try:
+        async with GPT_SCHEDULER.slot(priority, estimate_tokens(user_text, history), deadline, on_queued) as ticket:
+            record_queue_wait()
+            GPT_IN_FLIGHT.inc()
+            t_admit = loop.time()
+            try:
+                async for delta in resilient_stream(attempt, deadline, GPT_RETRY_POLICY, TTFT_WINDOW, info):
+                    yield delta
+            finally:
+                GPT_IN_FLIGHT.dec()
+                if "attempt" in info:
+                    GPT_ATTEMPT_WINS.inc(str(info["attempt"]))
+                    GPT_RETRIES.inc(amount=info["retries"])
+                    if info["hedged"]:
+                        GPT_HEDGES.inc()
+                # 재시도/hedge로 나간 요청까지 실제 사용량을 토큰 예산에 반영
+                spent = sum(u.get("prompt_tokens", 0) + u.get("completion_tokens", 0) for u in usages.values())
+                GPT_SCHEDULER.settle(ticket, spent)
+                if "attempt" in info and usage is not None:
+                    usage.update(usages.get(info["attempt"], {}))
+                if timing is not None:
+                    timing.update(timings.get(info.get("attempt"), {}))
+                    timing["generation"] = loop.time() - t_admit
+    finally:
+        record_queue_wait()
+
+async def _stream_completion(messages: list[dict], usage: dict, timing: dict | None = None):
+    # timing: connect(응답 헤더까지), ttft(첫 토큰까지) — 이 시도의 요청 시작 기준
+    t0 = time.perf_counter()
+    ttft = None
+    stream = await get_client().chat.completions.create(
         model=MODEL_NAME,
         messages=messages,
         temperature=0.3,
+        stream=True,
+        stream_options={"include_usage": True},
     )
-    return resp.choices[0].message.content.strip()
+    if timing is not None:
+        timing["connect"] = time.perf_counter() - t0
+    async for chunk in stream:
+        if chunk.usage is not None:
+            record_usage(chunk.usage, usage)
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            if ttft is None:
+                ttft = time.perf_counter() - t0
+                if timing is not None:
+                    timing["ttft"] = ttft
+            yield delta
+    if ttft is not None:
+        GPT_TTFT_SECONDS.observe(ttft, "hit" if usage.get("cached_tokens") else "miss")
+
+def record_usage(u, usage: dict):
+    details = getattr(u, "prompt_tokens_details", None)
+    usage["prompt_tokens"] = u.prompt_tokens
+    usage["completion_tokens"] = u.completion_tokens
+    usage["cached_tokens"] = (getattr(details, "cached_tokens", None) or 0) if details else 0
+    PROMPT_TOKENS.inc(amount=usage["prompt_tokens"])
+    CACHED_PROMPT_TOKENS.inc(amount=usage["cached_tokens"])
+    COMPLETION_TOKENS.inc(amount=usage["completion_tokens"])
+
+async def ask_gpt(user_text: str, history: list[dict], usage: dict | None = None,
+                  deadline: float | None = None, info: dict | None = None,
+                  priority: float = float("inf"), on_queued=None, timing: dict | None = None) -> str:
+    parts = [delta async for delta in ask_gpt_stream(
+        user_text, history, usage, deadline, info, priority, on_queued, timing
+    )]
+    return "".join(parts).strip()
+
+def turn_deadline(s: Session) -> float:
+    # 이번 턴 생성 마감 시각: 세션 남은 시간에서 여유분을 뺀 만큼 (최소 1초)
+    budget = min(GPT_TIMEOUT_SECONDS, max(1.0, remaining_time(s) - GPT_DEADLINE_MARGIN_SECONDS))
+    return asyncio.get_running_loop().time() + budget
+
+
+# 추천 질문 첫 턴 답변 캐시 (프롬프트/사실관계/모델이 바뀌면 자동 무효화)
+CACHE_DIR = Path(os.environ.get("CACHE_DIR", "cache"))
+CHIP_CACHE_ENABLED = os.environ.get("CHIP_CACHE", "1") == "1"
+CHIP_WARMUP = os.environ.get("CHIP_WARMUP", "1") == "1"
+CHIP_ANSWERS = ChipAnswerStore(CACHE_DIR / "chip_answers.json", SYSTEM_PROMPT, INCIDENT_FACTS, MODEL_NAME)
+CHIP_ANSWERS.load()
+
+# 대화 문맥(정규화한 history + 질문) 기반 응답 캐시. RESPONSE_CACHE_PATH를 주면 디스크에도 보관
+# (조회는 메모리, 디스크 쓰기는 전용 스레드. 다른 worker가 넣은 답변은 재시작할 때 읽어 온다)
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE", "1") == "1"
+RESPONSE_CACHE_PATH = os.environ.get("RESPONSE_CACHE_PATH", "")
+RESPONSE_CACHE = ResponseCache(
+    prompt_fp=PROMPT_PREFIX.fingerprint,
+    max_entries=int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "5000")),
+    max_bytes=int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    ttl_seconds=float(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", str(24 * 3600))),
+    path=Path(RESPONSE_CACHE_PATH) if RESPONSE_CACHE_PATH else None,
+)
+
+async def warm_chip_answers():
+    # ws_endpoint 첫 턴과 같은 모양(이전 history 없이 질문 하나)으로 생성
+    async def generate(label: str) -> str:
+        return await ask_gpt(label, [])
+
+    errors = await CHIP_ANSWERS.warm(sorted(CHIP_LABELS), generate)
+    for label, e in errors:
+        log_event({"event": "chip_warm_error", "label": label, "err": str(e)[:300]})
 
 
 # =========================
@@ -514,6 +874,10 @@ HTML = f"""
       opacity: .25;
       animation: blink 1.1s infinite;
     }}
+    .typing .queue-note {{
+      font-size: 12px;
+      color: var(--muted);
+    }}
     .typing .dots span:nth-child(2) {{ animation-delay: .15s; }}
     .typing .dots span:nth-child(3) {{ animation-delay: .30s; }}
     @keyframes blink {{
@@ -891,8 +1255,12 @@ HTML = f"""
     row.appendChild(bubble);
     chat.appendChild(row);
     chat.scrollTop = chat.scrollHeight;
+    return bubble;
   }}
 
+  // 스트리밍 중인 AI 말풍선 (ai_delta로 채우고 ai_done으로 확정)
+  let streamBubble = null;
+
   let typingRowEl = null;
 
 function showTyping() {{
@@ -915,6 +1283,20 @@ function showTyping() {{
   typingRowEl = row;
 }}
 
+// 생성 대기열에서 기다리는 중이면 typing 말풍선에 순번/예상 시간 표시
+function showQueued(position, etaSeconds) {{
+  showTyping();
+  let note = typingRowEl.querySelector(".queue-note");
+  if (!note) {{
+    note = document.createElement("span");
+    note.className = "queue-note";
+    typingRowEl.querySelector(".typing").appendChild(note);
+  }}
+  note.textContent = position > 0
+    ? `대기 중 (앞에 ${{position}}명, 약 ${{etaSeconds}}초)`
+    : `곧 답변을 시작합니다 (약 ${{etaSeconds}}초)`;
+}}
+
 function hideTyping() {{
   if (!typingRowEl) return;
   typingRowEl.remove();
@@ -967,10 +1349,20 @@ function hideTyping() {{
 
   // websocket
   const wsProto = (location.protocol === "https:") ? "wss" : "ws";
-  const ws = new WebSocket(`${{wsProto}}://${{location.host}}/ws?sid=${{encodeURIComponent(sid)}}`);
+  const wsUrl = `${{wsProto}}://${{location.host}}/ws?sid=${{encodeURIComponent(sid)}}`;
+  let ws = null;
+  // 마지막으로 받은 프레임 번호: 재접속하면 resume으로 알려서 놓친 프레임만 다시 받음
+  // outboxEpoch: 그 번호가 어느 outbox 기준인지 (서버 재시작/다른 worker면 달라지고 seq도 1부터 다시)
+  let lastSeq = 0;
+  let outboxEpoch = null;
+  // 채팅 화면을 열었는지: 서버는 start를 받은 시각부터 시간 제한을 잰다
+  let chatStarted = false;
+  let reconnect = true;
+  let reconnectDelay = 500;
+  let connErrorShown = false;
 
   function wsSend(obj) {{
-    if(ws.readyState === 1) ws.send(JSON.stringify(obj));
+    if(ws && ws.readyState === 1) ws.send(JSON.stringify(obj));
   }}
 
   let state = {{
@@ -1001,64 +1393,140 @@ function hideTyping() {{
     return `${{m}}:${{s}}`;
   }}
 
+  // 종료는 서버 시계가 알려준다 (time_over + 연결 종료). 서버 응답이 없을 때만 여기서 마무리
+  function endLocally() {{
+    if(state.phase === "done") return;
+    state.phase = "done";
+    updateHint();
+    addBubble("AI", "대화 시간이 종료되었습니다. 참여해주셔서 감사합니다.");
+    reconnect = false;
+    try {{ ws.close(); }} catch(e) {{}}
+  }}
+
   function tickTimer() {{
-    timerEl.textContent = formatTime(state.remainingSeconds);
+    timerEl.textContent = formatTime(Math.max(0, state.remainingSeconds));
     if(state.remainingSeconds <= 0) {{
       setUIEnabled(false);
-      state.phase = "done";
-      updateHint();
-      addBubble("AI", "대화 시간이 종료되었습니다. 참여해주셔서 감사합니다.");
-      try {{ ws.close(); }} catch(e) {{}}
+      setTimeout(endLocally, 5000);
       return;
     }}
     state.remainingSeconds -= 1;
     setTimeout(tickTimer, 1000);
   }}
 
-  ws.onopen = () => {{
-    wsSend({{ type: "hello", sid }});
-  }};
+  function onOpen() {{
+    reconnectDelay = 500;
+    connErrorShown = false;
+    // 이미 인사를 받은 세션(재접속/새로고침)이면 hello 대신 resume
+    if(sessionStorage.getItem("hello:" + sid)) {{
+      wsSend({{ type: "resume", sid, lastSeq, epoch: outboxEpoch }});
+    }} else {{
+      sessionStorage.setItem("hello:" + sid, "1");
+      wsSend({{ type: "hello", sid }});
+    }}
+    // 연결이 끊긴 사이에 시작 버튼을 눌렀을 수 있으므로 다시 알림 (서버는 처음 시각을 유지)
+    if(chatStarted) wsSend({{ type: "start", sid }});
+  }}
 
-  ws.onmessage = (ev) => {{
+  function applyFrame(msg) {{
+    if(msg.type === "ai") {{
+      // ✅ (D-1) 생성중 표시 제거
+      hideTyping();
+      // 기존대로 AI 말풍선 추가
+      addBubble("AI", msg.text);
+      // ✅ (D-2) 입력 다시 활성화 (세션 done이면 제외)
+      if(state.phase !== "done") setUIEnabled(true);
+    }}
+    if(msg.type === "queued") {{
+      showQueued(msg.position, msg.etaSeconds);
+    }}
+    if(msg.type === "ai_delta") {{
+      hideTyping();
+      if(!streamBubble) streamBubble = addBubble("AI", "");
+      streamBubble.textContent += msg.text;
+      chat.scrollTop = chat.scrollHeight;
+    }}
+    if(msg.type === "ai_done") {{
+      hideTyping();
+      if(streamBubble) streamBubble.textContent = msg.text;
+      else addBubble("AI", msg.text);
+      streamBubble = null;
+      if(state.phase !== "done") setUIEnabled(true);
+    }}
+    if(msg.type === "tick") {{
+      // 서버 시계 동기화 (setTimeout 지연으로 생긴 오차 보정)
+      state.remainingSeconds = msg.remainingSeconds;
+      timerEl.textContent = formatTime(state.remainingSeconds);
+    }}
+    if(msg.type === "state") {{
+      state.phase = msg.phase;
+      state.remainingQuestions = msg.remainingQuestions;
+      state.remainingSeconds = msg.remainingSeconds;
+      updateHint();
+      timerEl.textContent = formatTime(state.remainingSeconds);
+      if(state.phase === "done") {{
+        setUIEnabled(false);
+        
+        // 3~5초 후 종료 안내 오버레이
+        if(!endOverlayScheduled) {{
+          endOverlayScheduled = true;
+          setTimeout(showEndOverlay, 4000); // 4초
+        }}
+      }}
+    }}
+  }}
+
+  function onFrame(ev) {{
     try {{
       const msg = JSON.parse(ev.data);
-      if(msg.type === "ai") {{
-        // ✅ (D-1) 생성중 표시 제거
+      if(msg.type === "reset") {{
+        // 서버 outbox가 새로 만들어짐: 예전 번호는 버리고, 끊긴 턴 때문에 잠긴 입력을 풀어 준다
+        outboxEpoch = msg.ep;
+        lastSeq = 0;
         hideTyping();
-        // 기존대로 AI 말풍선 추가
-        addBubble("AI", msg.text);
-        // ✅ (D-2) 입력 다시 활성화 (세션 done이면 제외)
+        streamBubble = null;
         if(state.phase !== "done") setUIEnabled(true);
+        return;
       }}
-      if(msg.type === "state") {{
-        state.phase = msg.phase;
-        state.remainingQuestions = msg.remainingQuestions;
-        state.remainingSeconds = msg.remainingSeconds;
-        updateHint();
-        timerEl.textContent = formatTime(state.remainingSeconds);
-        if(state.phase === "done") {{
-          setUIEnabled(false);
-          
-          // 3~5초 후 종료 안내 오버레이
-          if(!endOverlayScheduled) {{
-            endOverlayScheduled = true;
-            setTimeout(showEndOverlay, 4000); // 4초
-          }}
+      if(msg.seq) {{
+        if(msg.ep !== outboxEpoch) {{
+          outboxEpoch = msg.ep;
+          lastSeq = 0;
         }}
+        // resume 재전송과 겹쳐 이미 적용한 프레임은 건너뜀
+        if(msg.seq <= lastSeq) return;
+        lastSeq = msg.seq;
       }}
+      // batch 프레임: 한 단계에서 나온 프레임들을 같은 렌더 안에서 차례로 적용
+      if(msg.type === "batch") msg.frames.forEach(applyFrame);
+      else applyFrame(msg);
     }} catch(e) {{}}
-  }};
+  }}
 
-  ws.onerror = () => {{
+  function onError() {{
     hideTyping();
     setUIEnabled(true);
+    if(connErrorShown) return;  // 재접속 시도마다 반복하지 않음
+    connErrorShown = true;
     addBubble("AI", "[연결 오류] 네트워크 상태를 확인해 주세요.");
-  }};
+  }}
 
-  ws.onclose = () => {{
+  function onClose() {{
     hideTyping();
-    // no spam
-  }};
+    // 대화가 끝나기 전에 끊겼으면 같은 sid로 다시 붙어 이어받음
+    if(!reconnect || state.phase === "done") return;
+    setTimeout(connect, reconnectDelay);
+    reconnectDelay = Math.min(reconnectDelay * 2, 8000);
+  }}
+
+  function connect() {{
+    ws = new WebSocket(wsUrl);
+    ws.onopen = onOpen;
+    ws.onmessage = onFrame;
+    ws.onerror = onError;
+    ws.onclose = onClose;
+  }}
+  connect();
 
   function sendText() {{
     const text = (input.value || "").trim();
@@ -1088,6 +1556,7 @@ function hideTyping() {{
 
   // Exit: close ws + hide overlay + show end message
   exitBtn.onclick = () => {{
+    reconnect = false;
     try {{ ws.close(); }} catch(e) {{}}
     overlay.style.display = "none";
     priming.style.display = "flex";
@@ -1316,6 +1785,8 @@ checkQuizBtn.onclick = () => {{
 startExperimentBtn.onclick = () => {{
   priming.style.display = "none";
   overlay.style.display = "flex";
+  chatStarted = true;
+  wsSend({{ type: "start", sid }});
   updateHint();
   tickTimer();
 }};
@@ -1327,13 +1798,158 @@ showStep(1);
 </html>
 """
 
+# 페이지는 기동 시 한 번만 렌더링/압축해 둔다.
+# SPLIT_ASSETS=1 이면 inline CSS/JS를 해시가 붙은 /assets/* 파일로 분리해 오래 캐시되게 한다.
+SPLIT_ASSETS = os.environ.get("SPLIT_ASSETS", "0") == "1"
+_page_html, PAGE_ASSETS = split_inline_assets(HTML) if SPLIT_ASSETS else (HTML, {})
+HOME_PAGE = PrecompressedAsset(_page_html.encode("utf-8"), "text/html; charset=utf-8", HTML_CACHE_CONTROL)
+
+# =========================
+# 6) 앱 수명주기
+# =========================
+_warm_task: asyncio.Task | None = None
+_stats_task: asyncio.Task | None = None
+
+async def on_startup():
+    global _warm_task, _stats_task
+    SESSION_CLOCK.start()
+    _stats_task = asyncio.create_task(refresh_session_stats())
+    if os.environ.get("PROFILE", "0") == "1":
+        PROFILER.start()
+    # 이전 실행에서 잘렸지만 아직 압축/manifest에 안 들어간 세그먼트 정리
+    LOG_ARCHIVE.recover({
+        f"{LOG_FILE.stem}-*{LOG_FILE.suffix}": ("events", "jsonl"),
+        f"{FOLLOWUP_CSV.stem}-*{FOLLOWUP_CSV.suffix}": ("followup", "csv"),
+    })
+    if CHIP_CACHE_ENABLED and CHIP_WARMUP and CHIP_ANSWERS.missing(CHIP_LABELS):
+        # 서버 기동을 막지 않도록 백그라운드로 채움
+        _warm_task = asyncio.create_task(warm_chip_answers())
+
+async def on_shutdown():
+    for task in (_warm_task, _stats_task):
+        if task and not task.done():
+            task.cancel()
+    await SESSION_CLOCK.stop()
+    if PROFILER.enabled:
+        # 켜 둔 채로 종료하면 결과를 logs/profile-*.collapsed / .json 으로 남긴다
+        PROFILER.dump(LOG_DIR)
+    await PROFILER.stop()
+    await close_client()
+    await asyncio.to_thread(RESPONSE_CACHE.close)
+    await _session_io(SESSIONS.close)
+    # 큐에 남은 로그까지 모두 기록하고 종료
+    await asyncio.to_thread(LOG_WRITER.close)
+    await asyncio.to_thread(LOG_ARCHIVE.close)
+
+
 @app.get("/")
-async def home():
-    return HTMLResponse(HTML)
+async def home(request: Request):
+    return HOME_PAGE.response(request)
+
+@app.get("/assets/{name}")
+async def page_asset(name: str, request: Request):
+    asset = PAGE_ASSETS.get(name)
+    if asset is None:
+        raise HTTPException(status_code=404)
+    return asset.response(request)
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# =========================
+# 관리자 대시보드 (/admin)
+# =========================
+# ADMIN_TOKEN을 설정해야 열리고(?token= 이 일치해야 함), 없으면 /admin 경로는 모두 404.
+# (같은 머신의 reverse proxy 뒤에서는 모든 접속이 loopback으로 보이므로 주소로는 거르지 않는다)
+# 집계는 이 프로세스가 받은 이벤트만 센다. WORKERS>1 이면 worker 하나의 몫만 보이므로
+# 전체 현황은 WORKERS=1로 띄우거나 events.jsonl / logdb 로 본다.
+# 집계는 LIVE_STATS가 이벤트마다 갱신하고, 관리자 웹소켓은 ADMIN_PUSH_SECONDS마다 최신 집계를 보낸다
+# (직렬화는 초당 한 번, 모든 관리자 연결이 같은 문자열을 공유).
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+ADMIN_PUSH_SECONDS = float(os.environ.get("ADMIN_PUSH_SECONDS", "1"))
+ADMIN_PAGE = PrecompressedAsset(ADMIN_HTML.encode("utf-8"), "text/html; charset=utf-8", HTML_CACHE_CONTROL)
+
+def admin_allowed(token: str | None) -> bool:
+    if not ADMIN_TOKEN:
+        return False
+    return hmac.compare_digest((token or "").encode(), ADMIN_TOKEN.encode())
+
+def require_admin(request: Request):
+    if not admin_allowed(request.query_params.get("token")):
+        raise HTTPException(status_code=404)
+
+@app.get("/admin")
+async def admin_page(request: Request):
+    require_admin(request)
+    return ADMIN_PAGE.response(request)
+
+@app.get("/admin/profile")
+async def admin_profile(request: Request):
+    require_admin(request)
+    return PROFILER.histograms()
+
+@app.get("/admin/profile/collapsed")
+async def admin_profile_collapsed(request: Request):
+    require_admin(request)
+    return PlainTextResponse(PROFILER.collapsed())
+
+@app.post("/admin/profile/{action}")
+async def admin_profile_action(action: str, request: Request):
+    # start | stop | reset | dump (dump: logs/ 에 파일로 저장)
+    require_admin(request)
+    if action == "start":
+        PROFILER.start()
+    elif action == "stop":
+        await PROFILER.stop()
+    elif action == "reset":
+        PROFILER.reset()
+    elif action == "dump":
+        return {"files": [str(p) for p in PROFILER.dump(LOG_DIR)]}
+    else:
+        raise HTTPException(status_code=404)
+    return {"enabled": PROFILER.enabled}
+
+@app.websocket("/admin/ws")
+async def admin_ws(ws: WebSocket):
+    if not admin_allowed(ws.query_params.get("token")):
+        await ws.close(code=1008)
+        return
+    await ws.accept()
+    last = None
+    try:
+        while True:
+            text = LIVE_STATS.frame()
+            if text != last:
+                await ws.send_text(text)
+                last = text
+            try:
+                # 관리자 쪽에서 보내는 것은 없음: 끊김 감지 겸 다음 갱신까지 대기
+                await asyncio.wait_for(ws.receive_text(), ADMIN_PUSH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+    except WebSocketDisconnect:
+        pass
+
+# 내용이 고정된 안내 프레임은 기동 시 한 번만 직렬화
+FRAME_HELLO = frames.ai(
+    "안녕하세요. 저는 본 사건에 대해 회사의 공식 입장을 전달하는 AI 대변인 Eline입니다.\n\n"
+    "먼저 이번 개인정보 유출 사고로 불편과 걱정을 드린 점 사과드립니다.\n\n"
+    "추천 질문을 참고해 궁금하신 내용을 직접 타이핑하거나 클릭하여 입력해 주세요. (최대 3회 / 총 3분)"
+)
+FRAME_LIMIT = frames.ai("질문 횟수(3회)가 모두 사용되었습니다. 마지막으로 추가로 하고 싶은 말씀이 있나요?")
+FRAME_TIME_OVER = frames.ai("대화 시간이 종료되었습니다. 참여해주셔서 감사합니다.")
+FRAME_PHASE_BLOCKED = frames.ai("현재 단계에서는 이 입력을 받을 수 없습니다.")
+FRAME_FOLLOWUP = frames.ai("마지막으로 추가로 하고 싶은 말씀이 있나요? (이 답변은 별도로 저장됩니다.)")
+FRAME_DONE = frames.ai("감사합니다. AI 대변인과의 대화가 종료되었습니다.")
+FRAME_UNKNOWN = frames.ai("알 수 없는 요청입니다.")
+FRAME_TOO_LONG = frames.ai("질문이 너무 깁니다. 조금 줄여서 다시 입력해 주세요.")
 
 @app.websocket("/ws")
 async def ws_endpoint(ws: WebSocket):
     await ws.accept()
+    WS_CONNECTS.inc()
+    conn_id = id(ws)
 
     sid = None
     try:
@@ -1344,125 +1960,274 @@ async def ws_endpoint(ws: WebSocket):
 
     client_ip = ws.client.host if ws.client else None
 
-    s = get_session(sid)
-    log_event({"event": "connect", "sid": sid, "ip": client_ip})
+    s = await get_session(sid)
+    ACTIVE_CONNECTIONS[conn_id] = s
+    log_event({"event": "connect", "sid": sid, "ip": client_ip, "phase": s.phase})
+
+    state_frame = frames.StateFrame()
+    # 모든 프레임은 세션 outbox를 거쳐 나간다 (seq 부여/보관, 끊겨도 생성은 계속됨)
+    outbox = get_outbox(sid)
+    out = frames.FrameSender(ws.send_text, batch=BATCH_FRAMES, outbox=outbox)
 
     async def send_state():
-        await ws.send_text(json.dumps({
-            "type": "state",
-            "phase": s["phase"],
-            "remainingQuestions": max(0, MAX_QUESTIONS - s["count"]),
-            "remainingSeconds": remaining_time(s),
-        }, ensure_ascii=False))
+        with PROFILER.stage("send_state"):
+            await out.send(state_frame.encode(s.phase, max(0, MAX_QUESTIONS - s.count), remaining_time(s)))
+
+    async def send_queued(position: int, eta: int):
+        # 생성 대기열에서 기다리는 중: 앞에 몇 명, 대략 몇 초
+        await out.send_now(frames.queued(position, eta))
+
+    async def expire():
+        # 세션 시계가 만료를 알림: 입력이 없어도 서버가 먼저 종료 안내를 보내고 연결을 닫는다
+        try:
+            if s.phase != "done" and await set_phase(s, "done", expected=s.phase):
+                log_event({"event": "time_over", "sid": sid, "by": "clock"})
+                await send_state()
+                await out.send(FRAME_TIME_OVER)
+                await out.flush()
+            await ws.close()
+        except Exception:
+            pass
+
+    async def tick():
+        # 남은 시간 동기화 (보관/재전송할 필요 없으므로 outbox를 거치지 않음)
+        try:
+            await ws.send_text(frames.tick(remaining_time(s)))
+        except Exception:
+            pass
 
+    # 세션 시계는 채팅을 시작한 뒤에만 돈다 (priming 중에 종료 안내가 뜨지 않도록)
+    clock_entry = None
+    if s.chat_ts is not None:
+        clock_entry = SESSION_CLOCK.register(conn_id, s.chat_ts + TIME_LIMIT_SECONDS, expire, tick)
+
+    async def block_limit():
+        await set_phase(s, "followup", expected="qa")
+        log_event({"event": "blocked_message_limit", "sid": sid})
+        await send_state()
+        await out.send(FRAME_LIMIT)
+
+    # 프로파일링: 메시지 하나(ws) 아래에 분기(mtype)를 두고, 분기는 다음 입력을 기다리기 직전에 닫는다
+    # (분기 안에 continue/break가 많아 with로 감싸지 않음)
+    prof_message = prof_branch = None
     try:
         while True:
+            if clock_entry is not None and clock_entry.expired:
+                # 처리 중에 세션 시계가 이미 종료시키고 연결을 닫음
+                break
+            # 이전 메시지 처리에서 모인 프레임을 한 번에 내보내고 다음 입력을 기다림
+            with PROFILER.stage("flush"):
+                await out.flush()
+            PROFILER.pop(prof_branch)
+            PROFILER.pop(prof_message)
+            prof_message = prof_branch = None
             raw = await ws.receive_text()
-            try:
-                payload = json.loads(raw)
-            except Exception:
-                payload = {"type": "unknown", "raw": raw}
+            t_recv = time.perf_counter()
+            prof_message = PROFILER.push("ws")
+            with PROFILER.stage("parse"):
+                try:
+                    payload = frames.loads(raw)
+                except Exception:
+                    payload = {"type": "unknown", "raw": raw}
 
             mtype = payload.get("type")
+            mtype_label = mtype if mtype in WS_MESSAGE_TYPES else "other"
+            WS_MESSAGES.inc(mtype_label)
+            # 다른 worker가 바꿨을 수 있으므로 매 메시지마다 최신 상태로
+            with PROFILER.stage("session_get"):
+                s = ACTIVE_CONNECTIONS[conn_id] = await get_session(sid)
+            prof_branch = PROFILER.push(mtype_label)
+
+            if mtype == "resume":
+                # 재접속: 클라이언트가 마지막으로 받은 seq 뒤의 프레임만 다시 보내고 이 연결이 이어받음
+                try:
+                    last_seq = int(payload.get("lastSeq") or 0)
+                except (TypeError, ValueError):
+                    last_seq = 0
+                epoch = payload.get("epoch")
+                replayed, gap, reset = await outbox.resume(ws.send_text, last_seq, epoch if isinstance(epoch, str) else None)
+                log_event({
+                    "event": "resume", "sid": sid, "last_seq": last_seq,
+                    "replayed": replayed, "gap": gap, "reset": reset,
+                })
+            elif outbox.sink != ws.send_text:
+                outbox.attach(ws.send_text)
+
+            if s.chat_ts is None and mtype in CHAT_START_TYPES and await start_chat(s):
+                log_event({"event": "chat_start", "sid": sid})
+            if clock_entry is None and s.chat_ts is not None:
+                clock_entry = SESSION_CLOCK.register(conn_id, s.chat_ts + TIME_LIMIT_SECONDS, expire, tick)
 
             # 시간 제한 체크 (서버 기준)
-            if remaining_time(s) <= 0 and s["phase"] != "done":
-                s["phase"] = "done"
+            if remaining_time(s) <= 0 and s.phase != "done":
+                await set_phase(s, "done")
                 log_event({"event": "time_over", "sid": sid})
                 await send_state()
-                await ws.send_text(json.dumps({
-                    "type": "ai",
-                    "text": "대화 시간이 종료되었습니다. 참여해주셔서 감사합니다."
-                }, ensure_ascii=False))
+                await out.send(FRAME_TIME_OVER)
+                await out.flush()
                 await ws.close()
                 break
 
             if mtype == "hello":
                 log_event({"event": "hello", "sid": sid})
-                first_msg = (
-                    "안녕하세요. 저는 본 사건에 대해 회사의 공식 입장을 전달하는 AI 대변인 Eline입니다.\n\n"
-                    "먼저 이번 개인정보 유출 사고로 불편과 걱정을 드린 점 사과드립니다.\n\n"
-                    "추천 질문을 참고해 궁금하신 내용을 직접 타이핑하거나 클릭하여 입력해 주세요. (최대 3회 / 총 3분)"
-                )
-                await ws.send_text(json.dumps({"type": "ai", "text": first_msg}, ensure_ascii=False))
+                await out.send(FRAME_HELLO)
+                await send_state()
+
+            elif mtype == "resume":
+                if outbox.seq == 0 and s.count == 0:
+                    # 이 프로세스에서 보낸 기록이 없는 새 세션이면 hello처럼 인사부터
+                    await out.send(FRAME_HELLO)
                 await send_state()
 
             elif mtype == "user_message":
-                if s["phase"] != "qa":
-                    log_event({"event": "blocked_message_phase", "sid": sid, "phase": s["phase"]})
-                    await ws.send_text(json.dumps({
-                        "type": "ai",
-                        "text": "현재 단계에서는 이 입력을 받을 수 없습니다."
-                    }, ensure_ascii=False))
+                if s.phase != "qa":
+                    log_event({"event": "blocked_message_phase", "sid": sid, "phase": s.phase})
+                    await out.send(FRAME_PHASE_BLOCKED)
                     await send_state()
                     continue
 
-                if s["count"] >= MAX_QUESTIONS:
-                    s["phase"] = "followup"
-                    log_event({"event": "blocked_message_limit", "sid": sid})
-                    await send_state()
-                    await ws.send_text(json.dumps({
-                        "type": "ai",
-                        "text": "질문 횟수(3회)가 모두 사용되었습니다. 마지막으로 추가로 하고 싶은 말씀이 있나요?"
-                    }, ensure_ascii=False))
+                if s.count >= MAX_QUESTIONS:
+                    await block_limit()
                     continue
 
                 user_text = str(payload.get("text", ""))[:2000].strip()
                 if not user_text:
                     await send_state()
                     continue
+                if count_tokens(user_text, MODEL_NAME) > HISTORY_TOKEN_BUDGET:
+                    # 질문 하나가 history 예산보다 크면 받지 않는다 (질문 횟수는 쓰지 않음).
+                    # 그래야 한 요청이 prefix + HISTORY_TOKEN_BUDGET 을 넘지 않는다
+                    log_event({"event": "blocked_message_length", "sid": sid, "chars": len(user_text)})
+                    await out.send(FRAME_TOO_LONG)
+                    await send_state()
+                    continue
+
+                # 질문 1회를 저장소에서 원자적으로 예약 (동시에 들어온 요청이 MAX_QUESTIONS를 넘지 않게)
+                with PROFILER.stage("reserve_question"):
+                    reserved = await reserve_question(s, MAX_QUESTIONS)
+                if not reserved:
+                    await block_limit()
+                    continue
 
                 # 로그
-                log_event({"event": "user_message", "sid": sid, "text": user_text[:500]})
+                # turn: 이 세션에서 몇 번째 질문인지 (turn_timing과 짝을 맞추는 id)
+                turn = s.count
+                log_event({
+                    "event": "user_message", "sid": sid, "turn": turn,
+                    "text": user_text[:500], "chip": user_text in CHIP_LABELS,
+                })
                 # 🔔 typing ON (GPT 응답 생성 시작)
-                await ws.send_text(json.dumps({
-                    "type": "typing",
-                    "on": True
-                }, ensure_ascii=False))
+                await out.send_now(frames.TYPING_ON)
 
-                # GPT 호출 (blocking 방지: thread로 돌림)
+                # GPT 호출 (AsyncOpenAI로 직접 await)
+                t_answer = time.perf_counter()
+                timing: dict = {}
+                send_seconds = 0.0
+                source = "gpt"
                 try:
-                    s["history"].append({"role": "user", "content": user_text})
-                    answer = await asyncio.to_thread(ask_gpt, user_text, s["history"])
-                    s["history"].append({"role": "assistant", "content": answer})
+                    first_turn = not s.history
+                    await append_history(s, "user", user_text)
+                    # 방금 넣은 질문은 build_messages가 맨 뒤에 붙이므로 그 앞까지만 (질문을 두 번 보내지 않음)
+                    history = trim_history(s)[:-1]
+                    cached = None
+                    if CHIP_CACHE_ENABLED and first_turn and user_text in CHIP_LABELS:
+                        cached = CHIP_ANSWERS.get(user_text)
+                    cache_key = None
+                    usage: dict = {}
+                    attempt_info: dict = {}
+                    deadline = turn_deadline(s)
+                    # 대기열에서는 세션 종료 시각이 가까운 참가자가 먼저
+                    priority = s.chat_ts + TIME_LIMIT_SECONDS
+                    if cached is not None:
+                        # 추천 질문 첫 턴: OpenAI 호출 없이 바로 응답
+                        source = "chip_cache"
+                        log_event({"event": "chip_cache_hit", "sid": sid})
+                    elif RESPONSE_CACHE_ENABLED:
+                        cache_key = RESPONSE_CACHE.make_key(history, user_text)
+                        cached = RESPONSE_CACHE.get(cache_key)
+                        if cached is not None:
+                            source = "response_cache"
+                            log_event({"event": "response_cache_hit", "sid": sid})
+
+                    if cached is not None:
+                        answer = cached
+                    elif STREAM_ANSWERS:
+                        parts = []
+                        prof_gpt = PROFILER.push("gpt")
+                        try:
+                            async for delta in ask_gpt_stream(
+                                user_text, history, usage, deadline, attempt_info, priority, send_queued, timing
+                            ):
+                                parts.append(delta)
+                                t_send = time.perf_counter()
+                                with PROFILER.stage("send_delta"):
+                                    await out.send_now(frames.ai_delta(delta))
+                                send_seconds += time.perf_counter() - t_send
+                        finally:
+                            PROFILER.pop(prof_gpt)
+                        answer = "".join(parts).strip()
+                    else:
+                        with PROFILER.stage("gpt"):
+                            answer = await ask_gpt(
+                                user_text, history, usage, deadline, attempt_info, priority, send_queued, timing
+                            )
+                    if cache_key is not None and cached is None and answer:
+                        RESPONSE_CACHE.put(cache_key, answer)
+                    await append_history(s, "assistant", answer)
+                    if attempt_info.get("queue_wait") is not None:
+                        log_event({"event": "gpt_queued", "sid": sid, "wait": attempt_info["queue_wait"]})
+                    if attempt_info.get("attempts", 1) > 1:
+                        # 재시도/hedge가 있었던 턴: 어느 시도가 답을 냈는지 기록
+                        log_event({"event": "gpt_attempt", "sid": sid, **attempt_info})
+                    if usage:
+                        # cached_tokens: provider prompt cache에서 처리된 prefix 토큰 수
+                        log_event({"event": "gpt_usage", "sid": sid, **usage})
+                    GPT_ANSWER_SECONDS.observe(time.perf_counter() - t_answer, "miss" if cached is None else "hit")
                 except Exception as e:
+                    OPENAI_ERRORS.inc(type(e).__name__)
+                    source = "error"
                     log_event({"event": "gpt_error", "sid": sid, "err": str(e)[:300]})
                     try:
-                         await ws.send_text(json.dumps({
-                              "type": "typing",
-                              "on": False
-                         }, ensure_ascii=False))
+                         await out.send(frames.TYPING_OFF)
                     except Exception:
                         pass
 
                     answer = "현재 응답 생성 과정에서 오류가 발생했습니다. 잠시 후 다시 시도해 주세요."
 
                 # 🔕 typing OFF (GPT 응답 생성 종료)
-                await ws.send_text(json.dumps({
-                    "type": "typing",
-                    "on": False
-                }, ensure_ascii=False))
+                t_send = time.perf_counter()
+                await out.send(frames.TYPING_OFF)
+
+                # 스트리밍 모드면 ai_done에 전체 텍스트를 실어 말풍선을 확정
+                await out.send(frames.ai_done(answer) if STREAM_ANSWERS else frames.ai(answer))
 
-                await ws.send_text(json.dumps({"type": "ai", "text": answer}, ensure_ascii=False))
+                # 참가자가 받은 최종 답변 전문 (스트리밍/캐시/오류 안내 모두)
+                log_event({"event": "ai_answer", "sid": sid, "turn": turn, "source": source, "text": answer})
 
-                # 카운트 증가
-                s["count"] += 1
-                log_event({"event": "count_inc", "sid": sid, "count": s["count"]})
+                # 카운트 증가 (예약해 둔 1회를 확정)
+                log_event({"event": "count_inc", "sid": sid, "count": s.count})
                 await send_state()
+                await out.flush()
+                send_seconds += time.perf_counter() - t_send
+                log_turn_timing(sid, turn, source, {
+                    "receive": t_answer - t_recv,
+                    "queue_wait": attempt_info.get("queue_wait"),
+                    "connect": timing.get("connect"),
+                    "ttft": timing.get("ttft"),
+                    "generation": timing.get("generation"),
+                    "send": send_seconds,
+                    "total": time.perf_counter() - t_recv,
+                }, usage)
 
                 # 3회 도달하면 followup 안내
-                if s["count"] >= MAX_QUESTIONS and s["phase"] == "qa":
-                    s["phase"] = "followup"
+                if s.count >= MAX_QUESTIONS and await set_phase(s, "followup", expected="qa"):
                     log_event({"event": "enter_followup", "sid": sid})
                     await send_state()
-                    await ws.send_text(json.dumps({
-                        "type": "ai",
-                        "text": "마지막으로 추가로 하고 싶은 말씀이 있나요? (이 답변은 별도로 저장됩니다.)"
-                    }, ensure_ascii=False))
+                    await out.send(FRAME_FOLLOWUP)
 
             elif mtype == "followup_answer":
-                if s["phase"] != "followup":
-                    log_event({"event": "blocked_followup_phase", "sid": sid, "phase": s["phase"]})
+                if s.phase != "followup":
+                    log_event({"event": "blocked_followup_phase", "sid": sid, "phase": s.phase})
                     await send_state()
                     continue
 
@@ -1471,34 +2236,39 @@ async def ws_endpoint(ws: WebSocket):
                     await send_state()
                     continue
 
+                # followup은 한 번만 저장되도록 phase를 먼저 원자적으로 done 처리
+                if not await set_phase(s, "done", expected="followup"):
+                    log_event({"event": "blocked_followup_phase", "sid": sid, "phase": s.phase})
+                    await send_state()
+                    continue
+
                 ts = time.time()
                 log_event({"event": "followup_answer", "sid": sid, "text": text[:500]})
-                log_followup(ts=ts, sid=sid, ip=client_ip, text=text)
+                await log_followup(ts=ts, sid=sid, ip=client_ip, text=text)
 
-                s["phase"] = "done"
                 log_event({"event": "done", "sid": sid})
                 await send_state()
 
-                await ws.send_text(json.dumps({
-                    "type": "ai",
-                    "text": "감사합니다. AI 대변인과의 대화가 종료되었습니다."
-                }, ensure_ascii=False))
+                await out.send(FRAME_DONE)
+                await out.flush()
                 await ws.close()
                 break
 
+            elif mtype == "start":
+                # 채팅 화면이 열림: 타이머를 서버 기준으로 맞춰 준다
+                await send_state()
+
             elif mtype == "exit":
                 log_event({"event": "exit", "sid": sid})
-                s["phase"] = "done"
+                await set_phase(s, "done")
                 await send_state()
+                await out.flush()
                 await ws.close()
                 break
 
             else:
                 log_event({"event": "unknown_input", "sid": sid, "raw": str(payload)[:500]})
-                await ws.send_text(json.dumps({
-                    "type": "ai",
-                    "text": "알 수 없는 요청입니다."
-                }, ensure_ascii=False))
+                await out.send(FRAME_UNKNOWN)
                 await send_state()
 
     except WebSocketDisconnect:
@@ -1509,9 +2279,27 @@ async def ws_endpoint(ws: WebSocket):
             await ws.close()
         except Exception:
             pass
+    finally:
+        PROFILER.pop(prof_branch)
+        PROFILER.pop(prof_message)
+        ACTIVE_CONNECTIONS.pop(conn_id, None)
+        SESSION_CLOCK.unregister(conn_id)
+        outbox.detach(ws.send_text)
+        if s.phase == "done" and outbox.sink is None:
+            OUTBOXES.pop(sid, None)
 
 
 if __name__ == "__main__":
+    if sys.argv[1:] == ["build-chip-cache"]:
+        # 오프라인으로 추천 질문 답변을 미리 생성: python main.py build-chip-cache
+        asyncio.run(warm_chip_answers())
+        print(f"{len(CHIP_LABELS) - len(CHIP_ANSWERS.missing(CHIP_LABELS))}/{len(CHIP_LABELS)} chip answers in {CHIP_ANSWERS.path}")
+        sys.exit(0)
+
     import uvicorn
     port = int(os.environ.get("PORT", "8000"))
-    uvicorn.run("main:app", host="0.0.0.0", port=port)
+    workers = int(os.environ.get("WORKERS", "1"))
+    if workers > 1 and SESSION_BACKEND == "memory":
+        print("WORKERS > 1 needs SESSION_BACKEND=sqlite or socket (memory sessions are per-process)", file=sys.stderr)
+        sys.exit(1)
+    uvicorn.run("main:app", host="0.0.0.0", port=port, workers=workers)
@@ -0,0 +1,132 @@
+# =========================
+# 프로세스 내 메트릭 (Prometheus text format)
+# =========================
+# ws_endpoint 루프 안에서 호출되므로 기록은 dict 갱신 한 번 정도로 끝나게 한다. (lock 없음)
+# 값 갱신은 거의 모두 이벤트 루프 스레드에서 일어나고, 다른 스레드(로그 기록기)는 자기 메트릭만 건드린다.
+from bisect import bisect_left
+
+# 초 단위 지연 버킷 (5ms ~ 60s)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+
+def _fmt_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *labelvalues, amount: float = 1):
+        self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        for lv, v in list(self.values.items()):
+            yield self.name, _fmt_labels(self.labels, lv), v
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), fn=None):
+        # fn이 있으면 scrape 시점에 {label 값 tuple: 값} 을 계산해서 쓴다
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.fn = fn
+        self.values: dict[tuple, float] = {}
+
+    def set(self, value: float, *labelvalues):
+        self.values[labelvalues] = value
+
+    def inc(self, *labelvalues, amount: float = 1):
+        self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues, amount: float = 1):
+        self.values[labelvalues] = self.values.get(labelvalues, 0) - amount
+
+    def samples(self):
+        values = self.values
+        if self.fn is not None:
+            try:
+                values = self.fn()
+            except Exception:
+                # 수집 실패한 gauge는 이번 scrape에서만 빠진다
+                return
+        for lv, v in list(values.items()):
+            yield self.name, _fmt_labels(self.labels, lv), v
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.series: dict[tuple, list] = {}  # label 값 -> [버킷별 개수..., +Inf 개수, 합계]
+
+    def observe(self, value: float, *labelvalues):
+        s = self.series.get(labelvalues)
+        if s is None:
+            s = self.series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+        s[bisect_left(self.buckets, value)] += 1
+        s[-1] += value
+
+    def snapshot(self, *labelvalues) -> tuple[list[int], float]:
+        s = self.series.get(labelvalues)
+        if s is None:
+            return [0] * (len(self.buckets) + 1), 0.0
+        return list(s[:-1]), s[-1]
+
+    def samples(self):
+        for lv, s in list(self.series.items()):
+            counts, total = s[:-1], s[-1]
+            acc = 0
+            for le, c in zip(self.buckets + (float("inf"),), counts):
+                acc += c
+                yield f"{self.name}_bucket", _fmt_labels(self.labels, lv, f'le="{_fmt_value(le)}"'), acc
+            yield f"{self.name}_sum", _fmt_labels(self.labels, lv), total
+            yield f"{self.name}_count", _fmt_labels(self.labels, lv), acc
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self.add(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: tuple[str, ...] = (), fn=None) -> Gauge:
+        return self.add(Gauge(name, help, labels, fn))
+
+    def histogram(self, name: str, help: str, labels: tuple[str, ...] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.add(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for m in self.metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            for name, labels, value in m.samples():
+                lines.append(f"{name}{labels} {_fmt_value(value)}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,192 @@
+# =========================
+# 로컬 OpenAI chat.completions 대역 (테스트/부하 측정용)
+# =========================
+# 실제 API 없이 서버를 돌려보기 위한 가짜 /v1/chat/completions.
+# 지연 분포(fixed / normal / longtail), 스트리밍 chunk 간격, 429/500/timeout 주입 비율을 조절해
+# 운영에서 보던 느린 상황을 재현할 수 있다.
+#
+#   python mock_openai.py --port 8001 --latency-profile longtail --latency 0.8 --rate-429 0.05
+#   OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=mock python main.py
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+from dataclasses import asdict, dataclass
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI()
+
+
+@dataclass
+class MockConfig:
+    latency_profile: str = "fixed"  # fixed | normal | longtail
+    latency: float = 0.5  # fixed 값 / normal 평균 / longtail 중앙값 (초)
+    latency_stddev: float = 0.2  # normal 표준편차
+    tail_sigma: float = 1.0  # longtail(lognormal) 꼬리 두께
+    chunk_size: int = 8  # 스트리밍 chunk당 글자 수
+    chunk_interval: float = 0.02  # chunk 사이 간격 (초)
+    chunk_jitter: float = 0.0  # chunk 간격 ± 흔들림 (초)
+    rate_429: float = 0.0
+    rate_500: float = 0.0
+    rate_timeout: float = 0.0  # 응답 없이 hang_seconds 동안 붙잡고 있음
+    hang_seconds: float = 600.0
+
+
+CONFIG = MockConfig()
+STATS: dict[str, int] = {}
+
+APOLOGY = "먼저 이번 일로 불편과 걱정을 드린 점 진심으로 사과드립니다. "
+CLOSING = " 추가로 확인되는 내용은 홈페이지 공지와 개별 안내를 통해 신속히 알려드리겠습니다."
+
+# 질문 키워드 -> 현재까지 확인된 사실 위주의 답변 본문
+TEMPLATES = [
+    (("경위", "원인"), "현재까지 확인된 바에 따르면 외부 접근 경로를 통해 일부 고객 개인정보에 대한 무단 접근이 발생했습니다. 접근 방식과 정확한 경위는 현재 추가 분석이 진행 중입니다."),
+    (("시점", "언제"), "현재까지 확인된 바로는 무단 접근이 2025년 8월 24일경부터 일정 기간 동안 발생한 것으로 파악되고 있습니다."),
+    (("영향", "범위", "유출된"), "무단 접근이 확인된 정보는 이름, 이메일 주소, 전화번호, 배송지 주소, 일부 주문 정보입니다. 계정 비밀번호, 로그인 정보, 결제 정보, 신용카드 정보는 포함되지 않았습니다."),
+    (("조치",), "회사는 사고 인지 이후 관련 시스템에 대한 접근 제한 조치와 보안 점검을 진행했습니다."),
+    (("서비스", "정상"), "본 사고로 인한 서비스 중단은 발생하지 않았으며, 서비스는 정상적으로 운영되고 있습니다."),
+    (("정부", "기관", "협력"), "현재 관계 기관과 협력하여 사고 원인 및 영향에 대한 조사를 진행하고 있습니다."),
+    (("해야 할", "당장"), "출처가 불분명한 문자나 이메일의 링크는 열지 마시고, 회사를 사칭한 연락에 각별히 주의해 주시기 바랍니다."),
+    (("문의", "지원"), "개별 문의는 고객센터와 전용 안내 창구를 통해 접수하고 있으며, 순차적으로 답변드리고 있습니다."),
+    (("여부", "확인하"), "유출 여부는 확인되는 대로 대상 고객께 개별적으로 안내드릴 예정입니다."),
+    (("재발", "방지"), "접근 통제와 보안 점검을 강화하고 있으며, 조사 결과를 바탕으로 재발 방지 대책을 마련하겠습니다."),
+    (("업데이트", "어디서"), "추가 업데이트는 공식 홈페이지 공지사항을 통해 안내드리겠습니다."),
+    (("완료", "수습"), "관계 기관과의 조사가 진행 중이어서 완료 시점을 단정하기는 어렵습니다."),
+]
+FALLBACK = "현재까지 확인된 사실을 중심으로 관계 기관과 협력하여 조사를 진행하고 있습니다."
+
+
+def _stat(key: str):
+    STATS[key] = STATS.get(key, 0) + 1
+
+
+def make_answer(messages: list[dict]) -> str:
+    question = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    body = next((text for keys, text in TEMPLATES if any(k in question for k in keys)), FALLBACK)
+    return APOLOGY + body + CLOSING
+
+
+def sample_latency() -> float:
+    c = CONFIG
+    if c.latency_profile == "normal":
+        return max(0.0, random.gauss(c.latency, c.latency_stddev))
+    if c.latency_profile == "longtail":
+        return random.lognormvariate(math.log(max(c.latency, 1e-3)), c.tail_sigma)
+    return c.latency
+
+
+def _tokens(text: str) -> int:
+    # 대략적인 토큰 수 (한글 1글자 ~ 1토큰, 영문 ~4글자 1토큰)
+    return max(1, len(text.encode("utf-8")) // 3)
+
+
+def _usage(messages: list[dict], answer: str) -> dict:
+    prompt = sum(_tokens(m.get("content", "")) for m in messages)
+    completion = _tokens(answer)
+    return {
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "total_tokens": prompt + completion,
+        "prompt_tokens_details": {"cached_tokens": 0},
+    }
+
+
+def _error(status: int, kind: str, message: str, headers: dict | None = None) -> JSONResponse:
+    return JSONResponse(
+        {"error": {"message": message, "type": kind, "param": None, "code": None}},
+        status_code=status,
+        headers=headers,
+    )
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    _stat("requests")
+    messages = body.get("messages", [])
+    cid = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+    model = body.get("model", "mock")
+
+    # 장애 주입: 비율은 서로 겹치지 않게 한 번의 난수로 고른다
+    roll = random.random()
+    if roll < CONFIG.rate_429:
+        _stat("429")
+        return _error(429, "rate_limit_exceeded", "Rate limit reached (mock)", {"retry-after": "1"})
+    roll -= CONFIG.rate_429
+    if roll < CONFIG.rate_500:
+        _stat("500")
+        return _error(500, "server_error", "The server had an error (mock)")
+    roll -= CONFIG.rate_500
+    if roll < CONFIG.rate_timeout:
+        _stat("timeout")
+        await asyncio.sleep(CONFIG.hang_seconds)
+        return _error(504, "timeout", "Request timed out (mock)")
+
+    await asyncio.sleep(sample_latency())
+    answer = make_answer(messages)
+    usage = _usage(messages, answer)
+    _stat("ok")
+
+    if not body.get("stream"):
+        return JSONResponse({
+            "id": cid,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+    def chunk(choices: list, **extra) -> str:
+        data = {"id": cid, "object": "chat.completion.chunk", "created": created, "model": model, "choices": choices}
+        data.update(extra)
+        return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    async def events():
+        size = max(1, CONFIG.chunk_size)
+        for i in range(0, len(answer), size):
+            yield chunk([{"index": 0, "delta": {"content": answer[i:i + size]}, "finish_reason": None}])
+            interval = CONFIG.chunk_interval + random.uniform(-CONFIG.chunk_jitter, CONFIG.chunk_jitter)
+            await asyncio.sleep(max(0.0, interval))
+        yield chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if include_usage:
+            yield chunk([], usage=usage)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/mock/stats")
+async def mock_stats():
+    return {"config": asdict(CONFIG), "stats": STATS}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="local stand-in for the OpenAI chat.completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-profile", choices=["fixed", "normal", "longtail"], default=CONFIG.latency_profile)
+    parser.add_argument("--latency", type=float, default=CONFIG.latency, help="fixed value / normal mean / longtail median (s)")
+    parser.add_argument("--latency-stddev", type=float, default=CONFIG.latency_stddev, help="normal profile stddev (s)")
+    parser.add_argument("--tail-sigma", type=float, default=CONFIG.tail_sigma, help="longtail profile lognormal sigma")
+    parser.add_argument("--chunk-size", type=int, default=CONFIG.chunk_size, help="characters per stream chunk")
+    parser.add_argument("--chunk-interval", type=float, default=CONFIG.chunk_interval, help="seconds between stream chunks")
+    parser.add_argument("--chunk-jitter", type=float, default=CONFIG.chunk_jitter, help="± jitter on chunk interval (s)")
+    parser.add_argument("--rate-429", type=float, default=CONFIG.rate_429, help="fraction of requests answered 429")
+    parser.add_argument("--rate-500", type=float, default=CONFIG.rate_500, help="fraction of requests answered 500")
+    parser.add_argument("--rate-timeout", type=float, default=CONFIG.rate_timeout, help="fraction of requests that hang")
+    parser.add_argument("--hang-seconds", type=float, default=CONFIG.hang_seconds, help="how long a timed-out request hangs")
+    args = vars(parser.parse_args())
+    host, port = args.pop("host"), args.pop("port")
+    CONFIG = MockConfig(**args)
+    uvicorn.run(app, host=host, port=port, log_level="warning")
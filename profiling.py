@@ -0,0 +1,176 @@
+# =========================
+# 구간(stage) 프로파일러 + 이벤트 루프 지연 측정
+# =========================
+# 서버가 느려졌을 때 시간이 JSON 파싱, log_event, send_state, 생성 대기열, 전송 중 어디로 가는지 보려고 쓴다.
+# 평소에는 꺼져 있고(stage()가 아무것도 안 하는 context 하나를 돌려줌) PROFILE=1 이나 관리자 endpoint로 켠다.
+#   - stage("이름")을 중첩하면 경로(ws;user_message;send_state)별로 벽시계 시간을 모은다.
+#     경로는 contextvar로 task마다 따로 이어지므로 연결끼리 섞이지 않는다.
+#   - 켜져 있는 동안 lag_interval마다 sleep이 얼마나 늦게 깨어나는지(이벤트 루프 지연)를 잰다.
+# 결과는 flamegraph.pl / speedscope가 읽는 collapsed stack(경로별 자기 시간, 마이크로초)이나
+# 구간별 히스토그램(JSON)으로 내보낸다.
+import asyncio
+import contextvars
+import json
+import time
+from contextlib import nullcontext
+from pathlib import Path
+
+from metrics import Histogram
+
+# 1µs ~ 약 90s, √2 간격 (구간 대부분이 1ms 미만이라 /metrics 버킷보다 촘촘하게)
+PROFILE_BUCKETS = tuple(1e-6 * 2 ** (i / 2) for i in range(54))
+LAG_STAGE = "event_loop_lag"
+
+_NULL = nullcontext()
+_current: contextvars.ContextVar = contextvars.ContextVar("profile_frame", default=None)
+
+
+class Frame:
+    __slots__ = ("path", "parent", "start", "child")
+
+    def __init__(self, path: tuple, parent: "Frame | None", start: float):
+        self.path = path
+        self.parent = parent
+        self.start = start
+        self.child = 0.0  # 안쪽 구간에서 쓴 시간 (자기 시간 = 전체 - child)
+
+
+class _Stage:
+    __slots__ = ("profiler", "name", "frame")
+
+    def __init__(self, profiler: "Profiler", name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.frame = self.profiler.push(self.name)
+
+    def __exit__(self, *exc):
+        self.profiler.pop(self.frame)
+        return False
+
+
+class Profiler:
+    def __init__(self, lag_interval: float = 0.1, pool_depth=None):
+        self.enabled = False
+        self.lag_interval = lag_interval
+        self.pool_depth = pool_depth  # (선택) 스레드 풀 대기 작업 수를 돌려주는 함수
+        self.started_at: float | None = None
+        self._lag_task: asyncio.Task | None = None
+        self.reset()
+
+    def reset(self):
+        self.hist = Histogram("profile_stage_seconds", "", ("stage",), PROFILE_BUCKETS)
+        self.self_seconds: dict[tuple, float] = {}
+        self.max_seconds: dict[str, float] = {}
+        self.max_pool_depth = 0
+        if self.enabled:
+            self.started_at = time.time()
+
+    # ---- 켜기/끄기 ----
+    def start(self):
+        if not self.enabled:
+            self.enabled = True
+            self.started_at = time.time()
+        if self._lag_task is None:
+            try:
+                self._lag_task = asyncio.get_running_loop().create_task(self._sample_lag())
+            except RuntimeError:
+                pass  # 루프 밖(import 시점): on_startup에서 다시 start()
+
+    async def stop(self):
+        self.enabled = False
+        task, self._lag_task = self._lag_task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _sample_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            t = loop.time()
+            await asyncio.sleep(self.lag_interval)
+            self._observe(LAG_STAGE, max(0.0, loop.time() - t - self.lag_interval))
+            if self.pool_depth is not None:
+                self.max_pool_depth = max(self.max_pool_depth, self.pool_depth())
+
+    # ---- 구간 ----
+    def stage(self, name: str):
+        # with PROFILER.stage("send_state"): ...  (꺼져 있으면 비용 거의 없음)
+        return _Stage(self, name) if self.enabled else _NULL
+
+    def push(self, name: str) -> Frame | None:
+        # with 블록으로 감싸기 어려운 곳(continue/break가 많은 분기)용: frame = push(); ...; pop(frame)
+        if not self.enabled:
+            return None
+        parent = _current.get()
+        frame = Frame((parent.path if parent else ()) + (name,), parent, time.perf_counter())
+        _current.set(frame)
+        return frame
+
+    def pop(self, frame: Frame | None):
+        if frame is None:
+            return
+        elapsed = time.perf_counter() - frame.start
+        # reset(token) 대신 부모로 되돌림 (async generator 정리가 다른 context에서 돌아도 안전)
+        _current.set(frame.parent)
+        if frame.parent is not None:
+            frame.parent.child += elapsed
+        self.self_seconds[frame.path] = self.self_seconds.get(frame.path, 0.0) + elapsed - frame.child
+        self._observe(";".join(frame.path), elapsed)
+
+    def _observe(self, stage: str, seconds: float):
+        self.hist.observe(seconds, stage)
+        if seconds > self.max_seconds.get(stage, 0.0):
+            self.max_seconds[stage] = seconds
+
+    # ---- 내보내기 ----
+    def collapsed(self) -> str:
+        # "ws;user_message;send_state 1234" (자기 시간, 마이크로초) — flamegraph.pl, speedscope 입력 형식
+        lines = [f"{';'.join(path)} {round(seconds * 1e6)}"
+                 for path, seconds in sorted(self.self_seconds.items()) if seconds > 0]
+        return "\n".join(lines) + ("\n" if lines else "")
+
+    def _quantile(self, counts: list[int], n: int, q: float) -> float:
+        rank, acc = q * n, 0
+        for le, c in zip(PROFILE_BUCKETS, counts):
+            acc += c
+            if acc >= rank:
+                return le
+        return float("inf")
+
+    def histograms(self) -> dict:
+        # 구간별 횟수/합계/분위수(버킷 상한 기준)/최대 + 버킷별 개수
+        stages = {}
+        for (stage,), _ in sorted(self.hist.series.items()):
+            counts, total = self.hist.snapshot(stage)
+            n = sum(counts)
+            stages[stage] = {
+                "count": n,
+                "total_seconds": total,
+                "mean_seconds": total / n if n else 0.0,
+                "p50_seconds": self._quantile(counts, n, 0.5),
+                "p95_seconds": self._quantile(counts, n, 0.95),
+                "p99_seconds": self._quantile(counts, n, 0.99),
+                "max_seconds": self.max_seconds.get(stage, 0.0),
+                "buckets": {f"{le:.6g}": c for le, c in zip(PROFILE_BUCKETS + (float("inf"),), counts) if c},
+            }
+        return {
+            "enabled": self.enabled,
+            "started_at": self.started_at,
+            "lag_interval": self.lag_interval,
+            "max_pool_depth": self.max_pool_depth,
+            "stages": stages,
+        }
+
+    def dump(self, directory: Path) -> list[Path]:
+        # profile-<UTC 시각>.collapsed / .json 두 파일로 저장
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+        collapsed = directory / f"profile-{stamp}.collapsed"
+        histograms = directory / f"profile-{stamp}.json"
+        collapsed.write_text(self.collapsed(), encoding="utf-8")
+        histograms.write_text(json.dumps(self.histograms(), indent=1), encoding="utf-8")
+        return [collapsed, histograms]
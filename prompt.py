@@ -0,0 +1,70 @@
+# =========================
+# 프롬프트 조립 + 토큰 계산
+# =========================
+# - 고정 prefix(SYSTEM_PROMPT + INCIDENT_FACTS)는 한 번만 만들어 모든 세션/턴에서 같은 바이트로 재사용한다.
+#   provider 쪽 prompt caching은 요청 앞부분이 완전히 같을 때만 적용되므로, prefix 뒤에만 history가 붙게 한다.
+# - history를 메시지 개수가 아니라 토큰 예산으로 자르기 위한 토큰 수 계산.
+#   tiktoken이 설치돼 있으면 모델 토크나이저로, 없으면 UTF-8 바이트 기반 근사치로 센다.
+import hashlib
+from functools import lru_cache
+
+try:
+    import tiktoken  # 선택 의존성 (pip install tiktoken)
+except ImportError:
+    tiktoken = None
+
+# 모델별 history 토큰 예산 (없는 모델은 DEFAULT_HISTORY_TOKEN_BUDGET)
+HISTORY_TOKEN_BUDGETS = {
+    "gpt-4.1": 4000,
+    "gpt-4.1-mini": 2000,
+    "gpt-4.1-nano": 1500,
+    "gpt-4o": 4000,
+    "gpt-4o-mini": 2000,
+}
+DEFAULT_HISTORY_TOKEN_BUDGET = 2000
+# 메시지 하나마다 role/구분자로 붙는 고정 오버헤드
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str, model: str) -> int:
+    enc = _encoding(model)
+    if enc is not None:
+        n = len(enc.encode(text))
+    else:
+        # 한글 1글자(3바이트) ~ 1토큰, 영문 3~4글자 ~ 1토큰
+        n = (len(text.encode("utf-8")) + 2) // 3
+    return n + MESSAGE_OVERHEAD_TOKENS
+
+
+def history_token_budget(model: str, override: str | None = None) -> int:
+    if override:
+        return int(override)
+    return HISTORY_TOKEN_BUDGETS.get(model, DEFAULT_HISTORY_TOKEN_BUDGET)
+
+
+class PromptPrefix:
+    def __init__(self, system_prompt: str, facts: str, model: str):
+        # 두 개였던 system 메시지를 하나로 합쳐 고정 블록으로 만든다
+        self.message = {"role": "system", "content": f"{system_prompt}\n\n{facts}"}
+        # 모델/prefix가 바뀌면 달라지는 지문 (응답 캐시 키에 들어감)
+        parts = (model, self.message["role"], self.message["content"])
+        self.fingerprint = hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+        self.tokens = count_tokens(self.message["content"], model)
+
+    def build(self, history: list[dict], user_text: str) -> list[dict]:
+        # prefix는 매번 같은 객체를 맨 앞에 두고, 가변 부분(history, 질문)은 그 뒤에만 붙인다
+        # history는 이번 질문 이전까지 (질문은 여기서 한 번만 붙인다)
+        messages = [self.message]
+        messages.extend({"role": m["role"], "content": m["content"]} for m in history)
+        messages.append({"role": "user", "content": user_text})
+        return messages
@@ -0,0 +1,29 @@
+# =========================
+# 추천 질문 / 질문 횟수
+# =========================
+# main.py(서버, 프론트 칩)와 loadtest.py가 같이 쓴다. main을 import하면 로그 디렉터리, 기록 스레드,
+# static mount 같은 서버 초기화가 같이 돌아가므로 상수만 따로 둔다.
+MAX_QUESTIONS = 3
+
+QUESTIONS = {
+    "사고 원인": [
+        ("q1", "사고 발생 경위가 어떻게 되나요?"),
+        ("q2", "발생 시점은 언제인가요?"),
+        ("q3", "영향 범위(유출된 정보)는 무엇인가요?"),
+    ],
+    "사고 대응": [
+        ("q4", "사고 이후 회사가 한 조치는 무엇인가요?"),
+        ("q5", "현재 서비스는 정상 운영 중인가요?"),
+        ("q6", "정부/외부기관과 협력은 어떻게 진행되나요?"),
+    ],
+    "보상 체계": [
+        ("q7", "사용자가 지금 당장 해야 할 조치는 뭔가요?"),
+        ("q8", "개별 문의/지원은 어디로 하면 되나요?"),
+        ("q9", "내 정보 유출 여부는 어떻게 확인하나요?"),
+    ],
+    "예방 및 미래 계획": [
+        ("q10", "재발 방지 계획은 무엇인가요?"),
+        ("q11", "추가 업데이트는 어디서 확인하나요?"),
+        ("q12", "사고 수습 예상 완료 시점은요?"),
+    ],
+}
@@ -0,0 +1,162 @@
+# =========================
+# GPT 호출 복원력: 마감시각(deadline) + 재시도 + hedging
+# =========================
+# 참가자의 3분은 업스트림이 느려도 계속 흐르므로, 한 턴의 생성은
+#   - 세션 남은 시간에서 정한 deadline 안에서만 시도하고
+#   - 429/5xx/연결 오류는 지터를 준 지수 backoff로 다시 시도하며
+#   - (선택) 첫 토큰이 평소 p95 만큼 지나도 안 오면 두 번째 요청을 같이 보내
+# 먼저 첫 토큰을 준 쪽을 채택하고 나머지는 취소한다.
+import asyncio
+import random
+from collections import deque
+from dataclasses import dataclass
+
+import openai
+
+
+@dataclass
+class RetryPolicy:
+    retries: int = 2  # 첫 시도 외 추가 시도 횟수
+    base_delay: float = 0.5
+    max_delay: float = 4.0
+    hedge: bool = False
+    hedge_percentile: float = 0.95
+    hedge_min_seconds: float = 1.0  # 너무 이른 hedge 방지
+    hedge_default_seconds: float = 3.0  # 표본이 모이기 전 기준값
+    hedge_min_samples: int = 20
+
+
+class TtftWindow:
+    # 최근 첫 토큰 지연 표본. hedge 기준(percentile) 계산용
+    def __init__(self, size: int = 500):
+        self.samples: deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def hedge_after(self, policy: RetryPolicy) -> float:
+        if len(self.samples) < policy.hedge_min_samples:
+            return policy.hedge_default_seconds
+        ordered = sorted(self.samples)
+        p = ordered[min(len(ordered) - 1, int(policy.hedge_percentile * len(ordered)))]
+        return max(policy.hedge_min_seconds, p)
+
+
+def is_retryable(e: BaseException) -> bool:
+    if isinstance(e, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+        return True
+    return isinstance(e, openai.APIStatusError) and (e.status_code == 429 or e.status_code >= 500)
+
+
+def retry_delay(e: BaseException, retry: int, policy: RetryPolicy) -> float:
+    # 서버가 Retry-After를 주면 그걸 따르고, 아니면 full jitter 지수 backoff
+    response = getattr(e, "response", None)
+    if response is not None:
+        try:
+            return min(policy.max_delay, float(response.headers.get("retry-after", "")))
+        except ValueError:
+            pass
+    return random.uniform(0, min(policy.max_delay, policy.base_delay * 2 ** retry))
+
+
+async def _discard(task: asyncio.Task, agen):
+    task.cancel()
+    try:
+        await task
+    except BaseException:
+        pass
+    try:
+        await agen.aclose()
+    except BaseException:
+        pass
+
+
+async def resilient_stream(make_attempt, deadline: float, policy: RetryPolicy, ttft: TtftWindow, info: dict):
+    # make_attempt(n) -> 델타를 yield하는 async generator (n: 1부터 시작하는 시도 번호)
+    # deadline: loop.time() 기준 절대 시각. info에는 승자 시도 번호/시도 수/재시도/hedge 여부가 채워진다.
+    loop = asyncio.get_running_loop()
+    pending: dict[asyncio.Task, tuple[int, object, float]] = {}  # task -> (시도 번호, agen, 시작 시각)
+    started = 0
+    retries = 0
+    hedged = False
+    retry_at: float | None = None
+    last_error: BaseException | None = None
+    winner = None
+
+    def start():
+        nonlocal started
+        started += 1
+        agen = make_attempt(started)
+        pending[asyncio.ensure_future(agen.__anext__())] = (started, agen, loop.time())
+
+    start()
+    try:
+        while winner is None:
+            now = loop.time()
+            if now >= deadline:
+                raise TimeoutError("generation deadline exceeded") from last_error
+            wake = deadline
+            hedge_at = None
+            if policy.hedge and not hedged and pending:
+                hedge_at = min(t for _, _, t in pending.values()) + ttft.hedge_after(policy)
+                wake = min(wake, hedge_at)
+            if retry_at is not None:
+                wake = min(wake, retry_at)
+
+            if pending:
+                done, _ = await asyncio.wait(pending, timeout=max(0.0, wake - now), return_when=asyncio.FIRST_COMPLETED)
+            else:
+                await asyncio.sleep(max(0.0, wake - now))
+                done = set()
+
+            for task in done:
+                n, agen, t0 = pending.pop(task)
+                try:
+                    first = task.result()
+                except StopAsyncIteration:
+                    first = None
+                except Exception as e:
+                    last_error = e
+                    await agen.aclose()
+                    continue
+                winner = (n, agen, t0, first)
+                break
+            if winner is not None:
+                break
+
+            now = loop.time()
+            if not pending and retry_at is None:
+                # 살아있는 시도가 없으면 재시도 예약 (불가능하면 마지막 오류를 그대로 올림)
+                if last_error is None or not is_retryable(last_error) or retries >= policy.retries:
+                    raise last_error or RuntimeError("no generation attempt succeeded")
+                retry_at = now + retry_delay(last_error, retries, policy)
+                retries += 1
+            if retry_at is not None and now >= retry_at:
+                retry_at = None
+                start()
+            elif hedge_at is not None and now >= hedge_at:
+                hedged = True
+                start()
+    finally:
+        for task, (_, agen, _) in list(pending.items()):
+            await _discard(task, agen)
+        pending.clear()
+
+    n, agen, t0, first = winner
+    ttft.add(loop.time() - t0)
+    info.update({"attempt": n, "attempts": started, "retries": retries, "hedged": hedged})
+    if first is None:
+        return
+    try:
+        yield first
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise TimeoutError("generation deadline exceeded")
+            try:
+                delta = await asyncio.wait_for(agen.__anext__(), remaining)
+            except StopAsyncIteration:
+                break
+            yield delta
+    finally:
+        await agen.aclose()
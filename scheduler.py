@@ -0,0 +1,188 @@
+# =========================
+# GPT 생성 스케줄러 (admission control + 공정 대기열)
+# =========================
+# 여러 참가자가 동시에 질문하면 모든 요청이 바로 업스트림으로 나가 provider rate limit에 한꺼번에 걸린다.
+# 그래서 ask_gpt 앞에 전역 대기열을 하나 두고
+#   - 동시에 나가는 요청 수(max_in_flight)
+#   - 최근 60초 동안 쓴 토큰 수(tokens_per_minute, 0이면 제한 없음)
+# 두 한도 안에서만 들여보낸다. 대기 순서는 세션 종료 시각이 가까운 순(남은 시간이 적은 참가자 먼저),
+# 같으면 먼저 온 순서. 이벤트 루프 스레드에서만 쓰므로 lock은 없다.
+import asyncio
+import heapq
+import itertools
+import math
+from collections import deque
+from contextlib import asynccontextmanager
+
+TOKEN_WINDOW_SECONDS = 60.0
+
+
+class Ticket:
+    __slots__ = ("priority", "seq", "tokens", "event", "admitted", "cancelled", "queued_at", "reservation")
+
+    def __init__(self, priority: float, seq: int, tokens: int, now: float):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.event = asyncio.Event()
+        self.admitted = False
+        self.cancelled = False
+        self.queued_at = now
+        self.reservation: list | None = None  # 토큰 창에 들어간 [시각, 토큰 수]
+
+    def __lt__(self, other: "Ticket") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class QueueTimeout(TimeoutError):
+    pass
+
+
+class GenerationScheduler:
+    def __init__(self, max_in_flight: int, tokens_per_minute: int = 0, update_interval: float = 1.0):
+        self.max_in_flight = max(1, max_in_flight)
+        self.tokens_per_minute = tokens_per_minute
+        self.update_interval = update_interval  # 대기 중 위치/예상 대기시간 갱신 주기
+        self.in_flight = 0
+        self._waiting: list[Ticket] = []  # heap (취소된 표는 꺼낼 때 버림)
+        self._live_waiting = 0
+        self._seq = itertools.count()
+        self._window: deque[list] = deque()  # [입장 시각, 토큰 수]
+        self._window_tokens = 0
+        self._wake: asyncio.TimerHandle | None = None
+        self._service_seconds = 5.0  # 한 생성이 슬롯을 잡고 있는 시간 (EWMA)
+        self.admitted_total = 0
+        self.queued_total = 0
+
+    # ---- 토큰 창 ----
+    def _expire(self, now: float):
+        while self._window and self._window[0][0] <= now - TOKEN_WINDOW_SECONDS:
+            self._window_tokens -= self._window.popleft()[1]
+
+    def _tokens_free_at(self, tokens: int, now: float) -> float:
+        # tokens 만큼 들어갈 자리가 나는 시각 (창이 비어 있으면 예산보다 큰 요청도 통과시킨다)
+        if not self.tokens_per_minute:
+            return now
+        used = self._window_tokens
+        for t, n in self._window:
+            if used + tokens <= self.tokens_per_minute:
+                break
+            used -= n
+            now = max(now, t + TOKEN_WINDOW_SECONDS)
+        return now
+
+    # ---- 입장 ----
+    def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        self._expire(now)
+        while self._waiting and self.in_flight < self.max_in_flight:
+            t = self._waiting[0]
+            if t.cancelled:
+                heapq.heappop(self._waiting)
+                continue
+            free_at = self._tokens_free_at(t.tokens, now)
+            if free_at > now:
+                # 토큰 예산이 찰 때까지 맨 앞 표를 붙잡아 둔다 (뒤 표가 앞지르지 않게)
+                if self._wake is None:
+                    self._wake = loop.call_at(free_at, self._on_wake)
+                break
+            heapq.heappop(self._waiting)
+            self._live_waiting -= 1
+            self._admit(t, now)
+
+    def _on_wake(self):
+        self._wake = None
+        self._dispatch()
+
+    def _admit(self, t: Ticket, now: float):
+        t.admitted = True
+        t.reservation = [now, t.tokens]
+        self._window.append(t.reservation)
+        self._window_tokens += t.tokens
+        self.in_flight += 1
+        self.admitted_total += 1
+        t.event.set()
+
+    def settle(self, t: Ticket, tokens: int):
+        # 추정치로 잡아둔 토큰을 실제 사용량(usage)으로 바로잡는다
+        if t.reservation is None or tokens <= 0:
+            return
+        self._window_tokens += tokens - t.reservation[1]
+        t.reservation[1] = tokens
+
+    def _release(self, t: Ticket, held: float | None):
+        self.in_flight -= 1
+        if held is not None:
+            self._service_seconds = 0.8 * self._service_seconds + 0.2 * held
+        self._dispatch()
+
+    # ---- 대기 정보 ----
+    def position(self, t: Ticket) -> int:
+        # 내 앞에 기다리는 표 수 (0이면 다음 차례)
+        return sum(1 for o in self._waiting if not o.cancelled and o < t)
+
+    def estimated_wait(self, t: Ticket) -> float:
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        ahead = self.position(t)
+        # 슬롯 기준: 앞 사람들이 max_in_flight 개씩 빠져나가는 시간
+        by_slots = 0.0
+        if self.in_flight + ahead >= self.max_in_flight:
+            by_slots = math.ceil((ahead + 1) / self.max_in_flight) * self._service_seconds
+        # 토큰 기준: 앞 사람들 몫까지 창에 들어갈 자리가 나는 시각
+        needed = t.tokens + sum(o.tokens for o in self._waiting if not o.cancelled and o < t)
+        by_tokens = self._tokens_free_at(needed, now) - now
+        return max(by_slots, by_tokens)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self._live_waiting,
+            "window_tokens": self._window_tokens,
+            "admitted": self.admitted_total,
+            "queued": self.queued_total,
+        }
+
+    @asynccontextmanager
+    async def slot(self, priority: float, tokens: int, deadline: float | None = None, on_queued=None):
+        # priority: 작을수록 먼저 (세션 종료 시각). tokens: 이번 요청 추정 토큰 수.
+        # on_queued(position, eta_seconds): 기다리는 동안 위치/예상 대기시간이 바뀔 때마다 await.
+        # deadline(loop.time() 기준)까지 입장 못 하면 QueueTimeout.
+        loop = asyncio.get_running_loop()
+        t = Ticket(priority, next(self._seq), tokens, loop.time())
+        heapq.heappush(self._waiting, t)
+        self._live_waiting += 1
+        self._dispatch()
+        if not t.admitted:
+            self.queued_total += 1
+            last = None
+            try:
+                while not t.admitted:
+                    if on_queued is not None:
+                        info = (self.position(t), round(self.estimated_wait(t)))
+                        if info != last:
+                            last = info
+                            await on_queued(*info)
+                    timeout = self.update_interval
+                    if deadline is not None:
+                        timeout = min(timeout, deadline - loop.time())
+                        if timeout <= 0:
+                            raise QueueTimeout("timed out waiting for a generation slot")
+                    try:
+                        await asyncio.wait_for(t.event.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                if t.admitted:
+                    self._release(t, None)
+                else:
+                    t.cancelled = True
+                    self._live_waiting -= 1
+                    self._dispatch()
+                raise
+        started = loop.time()
+        try:
+            yield t
+        finally:
+            self._release(t, loop.time() - started)
@@ -0,0 +1,467 @@
+# =========================
+# 세션 저장소
+# =========================
+# 마지막으로 접근(get)한 뒤 ttl이 지난 세션을 만료 시각 순서로 버린다.
+# (전체를 훑지 않고 heap 맨 앞 / 만료 시각 인덱스만 확인)
+# 페이지를 연 시각 기준이면 안내(priming) 화면이 길었던 참가자의 세션이 채팅 도중에 사라질 수 있다.
+#
+# uvicorn --workers N 으로 여러 프로세스를 띄우면 어느 worker든 같은 sid를 처리할 수 있어야 하므로
+# 저장소는 교체 가능하게 둔다.
+#   - memory : 프로세스 내부 (worker 1개일 때)
+#   - sqlite : WAL 모드 SQLite 파일 하나를 모든 worker가 공유
+#   - socket : `python sessions.py serve` 로 띄운 로컬 세션 서버에 접속
+# 질문 횟수(count)와 phase 전환은 저장소 안에서 원자적으로 처리해 동시 접근에도 일관성을 지킨다.
+import argparse
+import asyncio
+import heapq
+import json
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field, fields
+from pathlib import Path
+
+
+@dataclass(slots=True)
+class Session:
+    sid: str
+    start_ts: float
+    count: int = 0
+    phase: str = "qa"  # "qa" | "followup" | "done"
+    history: list[dict] = field(default_factory=list)  # (선택) GPT 문맥용, 메시지마다 "tokens" 포함
+    history_start: int = 0  # 토큰 예산 안에 드는 history 창의 시작 위치
+    history_tokens: int = 0  # history[history_start:] 의 토큰 합
+    chat_ts: float | None = None  # 안내(priming)를 마치고 채팅을 시작한 시각. 시간 제한은 여기부터
+
+
+def extend_history(s: Session, messages, token_budget: int | None = None):
+    # 메시지를 붙이고, 예산을 넘으면 창의 앞쪽을 한 칸씩 민다 (매번 전체를 다시 세지 않음)
+    # 마지막 메시지는 혼자 예산을 넘어도 남긴다. 질문이 예산을 넘지 않게 막는 것은 호출하는 쪽 몫
+    for m in messages:
+        s.history.append(m)
+        s.history_tokens += m.get("tokens", 0)
+    if token_budget is not None:
+        while s.history_tokens > token_budget and s.history_start < len(s.history) - 1:
+            s.history_tokens -= s.history[s.history_start].get("tokens", 0)
+            s.history_start += 1
+
+
+class SessionStore(ABC):
+    # 모든 저장소가 지키는 인터페이스. 변경은 반드시 아래 메서드로 하고,
+    # 성공하면 넘겨받은 Session 객체도 같이 갱신한다.
+    @abstractmethod
+    def get(self, sid: str) -> Session:
+        # 없으면 만들고, 있으면 만료 시각을 지금부터 ttl 뒤로 미룬다
+        ...
+
+    @abstractmethod
+    def reserve_question(self, s: Session, limit: int) -> bool:
+        # count < limit 일 때만 1 증가 (원자적)
+        ...
+
+    @abstractmethod
+    def set_phase(self, s: Session, phase: str, expected: str | None = None) -> bool:
+        # expected가 주어지면 현재 phase가 그것일 때만 바꾼다 (원자적)
+        ...
+
+    @abstractmethod
+    def start_chat(self, s: Session) -> bool:
+        # chat_ts가 비어 있을 때만 지금 시각으로 채운다 (원자적, 재접속/새로고침에도 처음 시각 유지)
+        ...
+
+    @abstractmethod
+    def append_history(self, s: Session, *messages: dict, token_budget: int | None = None):
+        ...
+
+    @abstractmethod
+    def stats(self) -> dict:
+        ...
+
+    def close(self):
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.sessions: dict[str, Session] = {}
+        self.expires_at: dict[str, float] = {}  # sid -> 마지막 접근 + ttl
+        # (만료 시각, sid) min-heap. get마다 넣지 않고, 꺼냈을 때 그 사이 접근이 있었으면 다시 넣는다
+        self.expiry: list[tuple[float, str]] = []
+        self.created = 0
+        self.evicted = 0
+
+    def get(self, sid: str) -> Session:
+        now = time.time()
+        self.evict_expired(now)
+        s = self.sessions.get(sid)
+        if s is None:
+            s = Session(sid=sid, start_ts=now)
+            self.sessions[sid] = s
+            heapq.heappush(self.expiry, (now + self.ttl_seconds, sid))
+            self.created += 1
+        self.expires_at[sid] = now + self.ttl_seconds
+        return s
+
+    def _current(self, s: Session) -> Session:
+        # 만료 후 다시 만들어진 경우 등을 대비해 저장소가 가진 객체 기준으로 처리
+        cur = self.sessions.get(s.sid)
+        if cur is None:
+            cur = self.sessions[s.sid] = s
+            self.expires_at[s.sid] = time.time() + self.ttl_seconds
+            heapq.heappush(self.expiry, (self.expires_at[s.sid], s.sid))
+        return cur
+
+    def reserve_question(self, s: Session, limit: int) -> bool:
+        cur = self._current(s)
+        if cur.count >= limit:
+            s.count = cur.count
+            return False
+        cur.count += 1
+        s.count = cur.count
+        return True
+
+    def set_phase(self, s: Session, phase: str, expected: str | None = None) -> bool:
+        cur = self._current(s)
+        if expected is not None and cur.phase != expected:
+            s.phase = cur.phase
+            return False
+        cur.phase = s.phase = phase
+        return True
+
+    def start_chat(self, s: Session) -> bool:
+        cur = self._current(s)
+        started = cur.chat_ts is None
+        if started:
+            cur.chat_ts = time.time()
+        s.chat_ts = cur.chat_ts
+        return started
+
+    def append_history(self, s: Session, *messages: dict, token_budget: int | None = None):
+        cur = self._current(s)
+        extend_history(cur, messages, token_budget)
+        if s is not cur:
+            s.history = list(cur.history)
+            s.history_start, s.history_tokens = cur.history_start, cur.history_tokens
+
+    def evict_expired(self, now: float | None = None) -> int:
+        now = time.time() if now is None else now
+        n = 0
+        while self.expiry and self.expiry[0][0] <= now:
+            _, sid = heapq.heappop(self.expiry)
+            expires_at = self.expires_at.get(sid)
+            if expires_at is None:
+                continue
+            if expires_at > now:
+                heapq.heappush(self.expiry, (expires_at, sid))  # 그 사이 다시 접근함
+                continue
+            del self.sessions[sid]
+            del self.expires_at[sid]
+            n += 1
+        self.evicted += n
+        return n
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def stats(self) -> dict:
+        return {
+            "live": len(self.sessions),
+            "created": self.created,
+            "evicted": self.evicted,
+        }
+
+
+class SqliteSessionStore(SessionStore):
+    EVICT_INTERVAL_SECONDS = 30.0
+
+    def __init__(self, path: Path, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=10.0, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " sid TEXT PRIMARY KEY, start_ts REAL NOT NULL, expires_at REAL NOT NULL,"
+            " count INTEGER NOT NULL DEFAULT 0, phase TEXT NOT NULL DEFAULT 'qa',"
+            " history TEXT NOT NULL DEFAULT '[]', history_start INTEGER NOT NULL DEFAULT 0,"
+            " history_tokens INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(sessions)")}
+        for column in ("history_start", "history_tokens"):
+            if column not in columns:
+                self.db.execute(f"ALTER TABLE sessions ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+        if "chat_ts" not in columns:
+            self.db.execute("ALTER TABLE sessions ADD COLUMN chat_ts REAL")
+        self.db.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+        self.created = 0
+        self.evicted = 0
+        self.next_evict = 0.0
+
+    @contextmanager
+    def _tx(self):
+        # BEGIN IMMEDIATE: 다른 worker와 동시에 쓰지 않도록 쓰기 잠금부터 잡는다
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+            self.db.execute("COMMIT")
+
+    @staticmethod
+    def _row(row) -> Session:
+        sid, start_ts, count, phase, history, history_start, history_tokens, chat_ts = row
+        return Session(sid=sid, start_ts=start_ts, count=count, phase=phase, history=json.loads(history),
+                       history_start=history_start, history_tokens=history_tokens, chat_ts=chat_ts)
+
+    def get(self, sid: str) -> Session:
+        now = time.time()
+        with self.lock:
+            if now >= self.next_evict:
+                self.next_evict = now + self.EVICT_INTERVAL_SECONDS
+                self.evicted += self.db.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,)).rowcount
+            cur = self.db.execute(
+                "INSERT OR IGNORE INTO sessions (sid, start_ts, expires_at) VALUES (?, ?, ?)",
+                (sid, now, now + self.ttl_seconds),
+            )
+            self.created += cur.rowcount
+            if cur.rowcount == 0:
+                self.db.execute("UPDATE sessions SET expires_at = ? WHERE sid = ?", (now + self.ttl_seconds, sid))
+            row = self.db.execute(
+                "SELECT sid, start_ts, count, phase, history, history_start, history_tokens, chat_ts"
+                " FROM sessions WHERE sid = ?", (sid,)
+            ).fetchone()
+        return self._row(row)
+
+    def reserve_question(self, s: Session, limit: int) -> bool:
+        with self._tx():
+            ok = self.db.execute(
+                "UPDATE sessions SET count = count + 1 WHERE sid = ? AND count < ?", (s.sid, limit)
+            ).rowcount == 1
+            s.count = self.db.execute("SELECT count FROM sessions WHERE sid = ?", (s.sid,)).fetchone()[0]
+        return ok
+
+    def set_phase(self, s: Session, phase: str, expected: str | None = None) -> bool:
+        with self._tx():
+            if expected is None:
+                ok = self.db.execute("UPDATE sessions SET phase = ? WHERE sid = ?", (phase, s.sid)).rowcount == 1
+            else:
+                ok = self.db.execute(
+                    "UPDATE sessions SET phase = ? WHERE sid = ? AND phase = ?", (phase, s.sid, expected)
+                ).rowcount == 1
+            s.phase = self.db.execute("SELECT phase FROM sessions WHERE sid = ?", (s.sid,)).fetchone()[0]
+        return ok
+
+    def start_chat(self, s: Session) -> bool:
+        with self._tx():
+            ok = self.db.execute(
+                "UPDATE sessions SET chat_ts = ? WHERE sid = ? AND chat_ts IS NULL", (time.time(), s.sid)
+            ).rowcount == 1
+            s.chat_ts = self.db.execute("SELECT chat_ts FROM sessions WHERE sid = ?", (s.sid,)).fetchone()[0]
+        return ok
+
+    def append_history(self, s: Session, *messages: dict, token_budget: int | None = None):
+        with self._tx():
+            row = self.db.execute(
+                "SELECT history, history_start, history_tokens FROM sessions WHERE sid = ?", (s.sid,)
+            ).fetchone()
+            s.history, s.history_start, s.history_tokens = (json.loads(row[0]), row[1], row[2]) if row else ([], 0, 0)
+            extend_history(s, messages, token_budget)
+            self.db.execute(
+                "UPDATE sessions SET history = ?, history_start = ?, history_tokens = ? WHERE sid = ?",
+                (json.dumps(s.history, ensure_ascii=False), s.history_start, s.history_tokens, s.sid),
+            )
+
+    def stats(self) -> dict:
+        with self.lock:
+            live = self.db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {"live": live, "created": self.created, "evicted": self.evicted}
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+# =========================
+# 로컬 소켓 세션 서버
+# =========================
+# 한 줄 JSON 요청/응답. 서버는 단일 이벤트 루프에서 MemorySessionStore를 다루므로 요청 하나하나가 원자적이다.
+def _parse_address(address: str):
+    # "/path/to.sock" 또는 "unix:/path" -> unix 소켓, "host:port" -> TCP
+    if address.startswith("unix:"):
+        return address[len("unix:"):]
+    if address.startswith("/"):
+        return address
+    host, _, port = address.rpartition(":")
+    return (host or "127.0.0.1", int(port))
+
+
+class SessionServer:
+    RECENT_REQUESTS = 10000
+
+    def __init__(self, ttl_seconds: float):
+        self.store = MemorySessionStore(ttl_seconds)
+        # 변경 요청의 rid -> 결과. 클라이언트가 응답을 못 받고 재전송해도 두 번 적용하지 않는다
+        self.recent: OrderedDict[str, dict] = OrderedDict()
+
+    def handle(self, req: dict):
+        op = req["op"]
+        if op == "stats":
+            return self.store.stats()
+        rid = req.get("rid")
+        if rid is not None and rid in self.recent:
+            return self.recent[rid]
+        result = self._apply(op, req)
+        if rid is not None:
+            self.recent[rid] = result
+            if len(self.recent) > self.RECENT_REQUESTS:
+                self.recent.popitem(last=False)
+        return result
+
+    def _apply(self, op: str, req: dict):
+        s = self.store.get(req["sid"])
+        ok = True
+        if op == "get":
+            pass
+        elif op == "reserve_question":
+            ok = self.store.reserve_question(s, req["limit"])
+        elif op == "set_phase":
+            ok = self.store.set_phase(s, req["phase"], req.get("expected"))
+        elif op == "start_chat":
+            ok = self.store.start_chat(s)
+        elif op == "append_history":
+            self.store.append_history(s, *req["messages"], token_budget=req.get("token_budget"))
+        else:
+            raise ValueError(f"unknown op: {op}")
+        return {"applied": ok, "session": asdict(s)}
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while line := await reader.readline():
+                try:
+                    resp = {"ok": True, "result": self.handle(json.loads(line))}
+                except Exception as e:
+                    resp = {"ok": False, "err": str(e)[:300]}
+                writer.write(json.dumps(resp, ensure_ascii=False).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, address: str):
+        addr = _parse_address(address)
+        if isinstance(addr, str):
+            Path(addr).unlink(missing_ok=True)
+            server = await asyncio.start_unix_server(self._client, path=addr)
+        else:
+            server = await asyncio.start_server(self._client, host=addr[0], port=addr[1])
+        async with server:
+            await server.serve_forever()
+
+
+class SocketSessionStore(SessionStore):
+    def __init__(self, address: str, timeout: float = 5.0):
+        self.address = _parse_address(address)
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.sock: socket.socket | None = None
+        self.rfile = None
+
+    def _connect(self):
+        family = socket.AF_UNIX if isinstance(self.address, str) else socket.AF_INET
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.address)
+        self.rfile = self.sock.makefile("rb")
+
+    def _reset(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = self.rfile = None
+
+    def _call(self, req: dict):
+        if req["op"] not in ("get", "stats"):
+            # 응답을 못 받아(timeout 등) 다시 보내도 서버가 한 번만 적용하도록 요청 id를 붙인다
+            req["rid"] = uuid.uuid4().hex
+        data = json.dumps(req, ensure_ascii=False).encode("utf-8") + b"\n"
+        with self.lock:
+            for attempt in (1, 2):
+                try:
+                    if self.sock is None:
+                        self._connect()
+                    self.sock.sendall(data)
+                    line = self.rfile.readline()
+                    if not line:
+                        raise ConnectionError("session server closed the connection")
+                    break
+                except OSError:
+                    # 세션 서버 재시작 등: 한 번 다시 연결해 본다
+                    self._reset()
+                    if attempt == 2:
+                        raise
+        resp = json.loads(line)
+        if not resp["ok"]:
+            raise RuntimeError(resp["err"])
+        return resp["result"]
+
+    def _apply(self, s: Session, req: dict) -> bool:
+        result = self._call(req)
+        d = result["session"]
+        for f in fields(Session):
+            setattr(s, f.name, d[f.name])
+        return result["applied"]
+
+    def get(self, sid: str) -> Session:
+        return Session(**self._call({"op": "get", "sid": sid})["session"])
+
+    def reserve_question(self, s: Session, limit: int) -> bool:
+        return self._apply(s, {"op": "reserve_question", "sid": s.sid, "limit": limit})
+
+    def set_phase(self, s: Session, phase: str, expected: str | None = None) -> bool:
+        return self._apply(s, {"op": "set_phase", "sid": s.sid, "phase": phase, "expected": expected})
+
+    def start_chat(self, s: Session) -> bool:
+        return self._apply(s, {"op": "start_chat", "sid": s.sid})
+
+    def append_history(self, s: Session, *messages: dict, token_budget: int | None = None):
+        self._apply(s, {"op": "append_history", "sid": s.sid, "messages": list(messages), "token_budget": token_budget})
+
+    def stats(self) -> dict:
+        return self._call({"op": "stats"})
+
+    def close(self):
+        with self.lock:
+            self._reset()
+
+
+def make_session_store(kind: str, ttl_seconds: float, sqlite_path: Path, address: str) -> SessionStore:
+    if kind == "memory":
+        return MemorySessionStore(ttl_seconds)
+    if kind == "sqlite":
+        return SqliteSessionStore(sqlite_path, ttl_seconds)
+    if kind == "socket":
+        return SocketSessionStore(address)
+    raise ValueError(f"unknown SESSION_BACKEND: {kind}")
+
+
+if __name__ == "__main__":
+    # 여러 worker가 공유할 세션 서버: python sessions.py serve --address 127.0.0.1:8765
+    parser = argparse.ArgumentParser(description="shared session server for multi-worker deployments")
+    parser.add_argument("command", choices=["serve"])
+    parser.add_argument("--address", default="127.0.0.1:8765", help="host:port or unix socket path")
+    parser.add_argument("--ttl", type=float, default=3 * 60 + 3600, help="session TTL in seconds")
+    args = parser.parse_args()
+    asyncio.run(SessionServer(args.ttl).serve(args.address))
@@ -0,0 +1,12 @@
+from dashboard import LiveStats
+
+
+def test_superseded_disconnect_keeps_resumed_session_live():
+    stats = LiveStats(clock=lambda: 1000.0)
+    stats.on_event({"event": "connect", "sid": "s1", "ts": 1.0})
+    stats.on_event({"event": "connect", "sid": "s1", "ts": 2.0})  # 재접속한 새 연결
+    stats.on_event({"event": "disconnect", "sid": "s1", "ts": 3.0})  # 예전 연결이 늦게 끊김
+    assert stats.snapshot()["active_sessions"] == 1
+
+    stats.on_event({"event": "disconnect", "sid": "s1", "ts": 4.0})
+    assert stats.snapshot()["active_sessions"] == 0
@@ -0,0 +1,50 @@
+from eventlog import FanoutSink, RotatingFile
+from logarchive import LogArchive
+
+
+def test_rotations_within_one_second_keep_every_segment(tmp_path):
+    path = tmp_path / "events.jsonl"
+    f = RotatingFile(path, "events", "jsonl", max_bytes=10)
+    for i in range(20):
+        f.write(f'{{"n": {i:02d}}}\n')  # 매번 max_bytes를 넘으므로 다음 write 때마다 rotate
+    f.close()
+
+    files = sorted(tmp_path.glob("events*.jsonl"))
+    assert len(files) == 20
+    lines = [line for p in files for line in p.read_text(encoding="utf-8").splitlines()]
+    assert sorted(lines) == sorted(f'{{"n": {i:02d}}}' for i in range(20))
+
+
+def test_recover_skips_segments_already_in_manifest(tmp_path):
+    archive = LogArchive(tmp_path, compression="none")
+    segment = tmp_path / "events-20260101T000000000.jsonl"
+    segment.write_text('{"n": 1}\n', encoding="utf-8")
+    archive._archive(segment, "events", "jsonl")  # 압축 없이 보관돼 이름이 그대로 남음
+
+    archive.recover({"events-*.jsonl": ("events", "jsonl")})
+    assert archive.queue.empty()
+
+
+class _Sink:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.records = []
+
+    def write(self, batch):
+        if self.fail:
+            raise OSError("disk full")
+        self.records.extend(batch)
+
+
+def test_failed_sink_keeps_records_and_does_not_block_others():
+    broken, ok = _Sink(fail=True), _Sink()
+    fanout = FanoutSink(broken, ok)
+    assert not fanout.write([("event", {"n": 1})])
+    assert ok.records == [("event", {"n": 1})]  # 다른 sink는 그대로 받음
+    assert fanout.pending_records() == 1
+
+    broken.fail = False
+    assert fanout.write([("event", {"n": 2})])
+    assert broken.records == [("event", {"n": 1}), ("event", {"n": 2})]  # 밀린 것부터 순서대로
+    assert ok.records == [("event", {"n": 1}), ("event", {"n": 2})]
+    assert fanout.pending_records() == 0
@@ -0,0 +1,45 @@
+import time
+
+from sessions import MemorySessionStore, Session, SessionServer, SqliteSessionStore, extend_history
+
+
+def test_resent_mutation_is_applied_once():
+    server = SessionServer(ttl_seconds=60)
+    req = {"op": "reserve_question", "sid": "s1", "limit": 3, "rid": "r1"}
+    first = server.handle(dict(req))
+    again = server.handle(dict(req))  # 응답을 못 받은 클라이언트의 재전송
+    assert first == again
+    assert server.handle({"op": "get", "sid": "s1"})["session"]["count"] == 1
+
+
+def test_chat_start_is_kept_across_reconnects(tmp_path):
+    for store in (MemorySessionStore(ttl_seconds=60), SqliteSessionStore(tmp_path / "sessions.sqlite", ttl_seconds=60)):
+        s = store.get("s1")
+        assert s.chat_ts is None  # priming 중에는 시간이 가지 않음
+        assert store.start_chat(s)
+        first = s.chat_ts
+        again = store.get("s1")  # 재접속한 연결이 다시 start를 보내도 처음 시각 유지
+        assert not store.start_chat(again)
+        assert again.chat_ts == first
+        store.close()
+
+
+def test_long_answer_leaves_the_window_when_the_next_question_arrives():
+    s = Session(sid="s1", start_ts=0.0)
+    extend_history(s, [{"role": "user", "content": "q1", "tokens": 10}], token_budget=100)
+    extend_history(s, [{"role": "assistant", "content": "a1", "tokens": 500}], token_budget=100)
+    extend_history(s, [{"role": "user", "content": "q2", "tokens": 20}], token_budget=100)
+    assert s.history[s.history_start:] == [{"role": "user", "content": "q2", "tokens": 20}]
+    assert s.history_tokens <= 100
+
+
+def test_session_accessed_during_chat_is_not_evicted(tmp_path):
+    for store in (MemorySessionStore(ttl_seconds=0.2), SqliteSessionStore(tmp_path / "sessions.sqlite", ttl_seconds=0.2)):
+        if isinstance(store, SqliteSessionStore):
+            store.EVICT_INTERVAL_SECONDS = 0
+        s = store.get("s1")
+        store.reserve_question(s, 3)
+        for _ in range(3):  # 처음 만든 뒤 ttl보다 오래 계속 접근
+            time.sleep(0.1)
+            assert store.get("s1").count == 1
+        store.close()
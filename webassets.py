@@ -0,0 +1,99 @@
+# =========================
+# 미리 압축해 둔 정적 응답 (HTML / 분리된 CSS·JS)
+# =========================
+# 페이지는 기동 시 한 번만 렌더링하고 gzip(+brotli가 설치돼 있으면 br) 버전을 미리 만들어 둔다.
+# 요청마다 Accept-Encoding에 맞는 바이트를 고르고, ETag가 같으면 304로 본문 없이 응답한다.
+import gzip
+import hashlib
+import re
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import brotli  # 선택 의존성 (pip install brotli)
+except ImportError:
+    brotli = None
+
+# 기동 시 한 번 하는 일이므로 최고 압축률로
+_ENCODERS = {"gzip": lambda body: gzip.compress(body, compresslevel=9, mtime=0)}
+if brotli is not None:
+    _ENCODERS["br"] = lambda body: brotli.compress(body, quality=11)
+_PREFERENCE = ["br", "gzip"]
+
+HTML_CACHE_CONTROL = "no-cache"  # 매번 재검증 (바뀌지 않았으면 304)
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def _accepted_encodings(header: str) -> set[str]:
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        m = re.search(r"q\s*=\s*([0-9.]+)", params)
+        if m:
+            try:
+                q = float(m.group(1))
+            except ValueError:
+                q = 0.0
+        if name and q > 0:
+            accepted.add(name)
+    return accepted
+
+
+class PrecompressedAsset:
+    def __init__(self, body: bytes, media_type: str, cache_control: str):
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self.digest = hashlib.sha256(body).hexdigest()
+        # 인코딩마다 바이트가 다르므로 strong ETag도 인코딩별로 구분
+        self.variants: dict[str, tuple[bytes, str]] = {"identity": (body, f'"{self.digest[:32]}"')}
+        for name, encode in _ENCODERS.items():
+            compressed = encode(body)
+            if len(compressed) < len(body):
+                self.variants[name] = (compressed, f'"{self.digest[:32]}-{name}"')
+        self.etags = {etag for _, etag in self.variants.values()}
+
+    def choose(self, accept_encoding: str) -> str:
+        accepted = _accepted_encodings(accept_encoding)
+        for name in _PREFERENCE:
+            if name in self.variants and (name in accepted or "*" in accepted):
+                return name
+        return "identity"
+
+    def response(self, request: Request) -> Response:
+        encoding = self.choose(request.headers.get("accept-encoding", ""))
+        body, etag = self.variants[encoding]
+        headers = {
+            "ETag": etag,
+            "Cache-Control": self.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if_none_match = request.headers.get("if-none-match", "")
+        if if_none_match.strip() == "*" or self.etags & {t.strip() for t in if_none_match.split(",")}:
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type=self.media_type, headers=headers)
+
+
+def split_inline_assets(html: str, prefix: str = "/assets") -> tuple[str, dict[str, PrecompressedAsset]]:
+    # <style>/<script> 블록을 내용 해시가 붙은 파일로 분리 -> 오래 캐시해도 내용이 바뀌면 주소가 바뀐다
+    assets: dict[str, PrecompressedAsset] = {}
+
+    def extract(pattern: str, ext: str, media_type: str, tag) -> None:
+        nonlocal html
+        m = re.search(pattern, html, flags=re.S)
+        if not m:
+            return
+        body = m.group(1).encode("utf-8")
+        name = f"app.{hashlib.sha256(body).hexdigest()[:16]}.{ext}"
+        assets[name] = PrecompressedAsset(body, media_type, IMMUTABLE_CACHE_CONTROL)
+        html = html[:m.start()] + tag(f"{prefix}/{name}") + html[m.end():]
+
+    extract(r"<style>(.*?)</style>", "css", "text/css; charset=utf-8",
+            lambda url: f'<link rel="stylesheet" href="{url}" />')
+    extract(r"<script>(.*?)</script>", "js", "text/javascript; charset=utf-8",
+            lambda url: f'<script src="{url}"></script>')
+    return html, assets